@@ -2,8 +2,12 @@ import os
 
 from flask_openapi3 import Info
 
+from database.cache import Cache
 from database.database import Database
+from database.instrumentation import QueryInstrumentation
 from log.log import Log
+from metrics.metrics import Metrics
+from resources.product_service import ProductService
 from resources.settings import Settings
 
 API_TITLE = os.environ.get("API_TITLE")
@@ -11,14 +15,114 @@ VERSION = os.environ.get("VERSION")
 SECRET_KEY = os.environ.get("SECRET_KEY")
 PORT = int(os.environ.get("PORT"))
 HOST = os.environ.get("HOST")
+SERVER_MODE = os.environ.get("SERVER_MODE", "development")
+WORKERS = int(os.environ.get("WORKERS", "2"))
+THREADS = int(os.environ.get("THREADS", "4"))
+DATABASE_URL = os.environ.get("DATABASE_URL")
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000")),
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", "-64000")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", "268435456")),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true") == "true"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", "10485760"))
+LOG_ROTATE_INTERVAL = float(os.environ.get("LOG_ROTATE_INTERVAL", "86400"))
+LOG_RETENTION_FILES = int(os.environ.get("LOG_RETENTION_FILES", "20"))
+LOG_RETENTION_BYTES = int(
+    os.environ.get("LOG_RETENTION_BYTES", "104857600")
+)
+SLOW_QUERY_THRESHOLD_MS = os.environ.get("SLOW_QUERY_THRESHOLD_MS")
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_TTL = float(os.environ.get("PRODUCT_CACHE_TTL", "30"))
+PRODUCT_SERVICE_URL = os.environ.get("PRODUCT_SERVICE_URL", "")
+PRODUCT_SERVICE_CONCURRENCY = int(
+    os.environ.get("PRODUCT_SERVICE_CONCURRENCY", "10")
+)
+PRODUCT_SERVICE_TIMEOUT = float(os.environ.get("PRODUCT_SERVICE_TIMEOUT", "2"))
+METRICS_DIRECTORY = os.environ.get(
+    "METRICS_DIRECTORY", os.path.join("metrics", "metrics-files")
+)
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
 
 INFORMATION = Info(title=API_TITLE, version=VERSION)
 
 flask_settings = Settings(
-    information=INFORMATION, secret_key=SECRET_KEY, port=PORT, host=HOST
+    information=INFORMATION,
+    secret_key=SECRET_KEY,
+    port=PORT,
+    host=HOST,
+    server_mode=SERVER_MODE,
+    workers=WORKERS,
+    threads=THREADS,
 )
 flask_settings.generate_app()
 
 app = flask_settings.app
-database = Database()
-log = Log()
+database = Database(
+    database_url=DATABASE_URL,
+    sqlite_pragmas=SQLITE_PRAGMAS,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+log = Log(
+    level=LOG_LEVEL,
+    log_format=LOG_FORMAT,
+    max_bytes=LOG_MAX_BYTES,
+    rotate_interval=LOG_ROTATE_INTERVAL,
+    retention_files=LOG_RETENTION_FILES,
+    retention_bytes=LOG_RETENTION_BYTES,
+)
+product_cache = Cache(max_size=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL)
+product_service = ProductService(
+    base_url=PRODUCT_SERVICE_URL,
+    max_concurrency=PRODUCT_SERVICE_CONCURRENCY,
+    timeout=PRODUCT_SERVICE_TIMEOUT,
+)
+metrics = Metrics(
+    directory=METRICS_DIRECTORY if SERVER_MODE == "production" else None,
+    flush_interval=METRICS_FLUSH_INTERVAL,
+)
+query_instrumentation = QueryInstrumentation(
+    log=log,
+    slow_query_threshold=(
+        None
+        if SLOW_QUERY_THRESHOLD_MS is None
+        else float(SLOW_QUERY_THRESHOLD_MS)
+    ),
+)
+
+app.teardown_appcontext(database.remove_session)
+query_instrumentation.register(app)
+metrics.register(app)
+metrics.register_gauge(
+    "db_pool_checked_out",
+    "Database connections checked out of the pool",
+    lambda: database.pool_status().get("checked_out"),
+)
+metrics.register_gauge(
+    "db_pool_overflow",
+    "Database connections opened beyond the pool size",
+    lambda: database.pool_status().get("overflow"),
+)
+metrics.register_gauge(
+    "log_queue_depth",
+    "Log messages waiting to be written",
+    lambda: log.queue_size,
+)
+metrics.register_gauge(
+    "product_cache_size",
+    "Products held in the product cache",
+    lambda: product_cache.stats["size"],
+)
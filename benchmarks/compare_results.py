@@ -0,0 +1,56 @@
+"""
+Compares two benchmark results written by run_benchmarks.py.
+
+    python benchmarks/compare_results.py baseline.json candidate.json
+"""
+import argparse
+import json
+
+METRICS = [
+    "p50_ms",
+    "p95_ms",
+    "p99_ms",
+    "requests_per_second",
+    "queries_per_request",
+]
+
+
+def read_results(path: str) -> dict:
+    """Reads a results file."""
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def main() -> None:
+    """Prints the change of each metric of each route."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    arguments = parser.parse_args()
+
+    baseline = read_results(arguments.baseline)
+    candidate = read_results(arguments.candidate)
+
+    print(
+        f"{baseline.get('label') or arguments.baseline} -> "
+        f"{candidate.get('label') or arguments.candidate}"
+    )
+
+    for route, candidate_metrics in candidate["routes"].items():
+        baseline_metrics = baseline["routes"].get(route)
+
+        if baseline_metrics is None:
+            continue
+
+        print(route)
+
+        for metric in METRICS:
+            before = baseline_metrics[metric]
+            after = candidate_metrics[metric]
+            change = (after - before) / before * 100 if before else 0.0
+
+            print(f"  {metric:<20} {before:>10} {after:>10} {change:>+8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
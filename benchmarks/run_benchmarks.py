@@ -0,0 +1,304 @@
+"""
+Load test of the HTTP routes through Flask's test client.
+
+Seeds a temporary SQLite database, drives each route and writes the
+latency percentiles, requests per second and queries per request as JSON,
+so the results of two commits can be compared with compare_results.py.
+
+    python benchmarks/run_benchmarks.py --products 10000 --sales 100000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPOSITORY_DIRECTORY = os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))
+)
+SEED_CHUNK_SIZE = 5000
+
+
+class Benchmark:
+    """Class to seed the database and measure the routes"""
+
+    def __init__(self, products: int, sales: int, requests: int, seed: int):
+        self._products = products
+        self._sales = sales
+        self._requests = requests
+        self._random = random.Random(seed)
+        self._queries = 0
+        self._client = None
+        self._open_sales = []
+
+    def _count_query(self, *args) -> None:
+        """Method to count each statement sent to the database"""
+        self._queries += 1
+
+    def setup(self, directory: str) -> None:
+        """Method to start the aplication over a temporary database"""
+        os.chdir(directory)
+        sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+        os.environ.setdefault("API_TITLE", "Online Store Benchmark")
+        os.environ.setdefault("VERSION", "benchmark")
+        os.environ.setdefault("SECRET_KEY", "benchmark")
+        os.environ.setdefault("PORT", "5000")
+        os.environ.setdefault("HOST", "127.0.0.1")
+        os.environ["DATABASE_URL"] = (
+            f"sqlite:///{os.path.join(directory, 'benchmark.sqlite3')}"
+        )
+
+        import main  # noqa: F401
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        from app import app, database
+
+        database.setup_database_environment()
+        event.listen(Engine, "before_cursor_execute", self._count_query)
+
+        self._client = app.test_client()
+
+    def seed(self) -> None:
+        """Method to fill the database with products and sales"""
+        from sqlalchemy import insert
+
+        from app import database
+        from database.model.product import Product
+        from database.model.sales import Sales
+        from resources.reports import (
+            backfill_sale_categories,
+            backfill_sales_summary,
+        )
+
+        session = database.SESSION()
+
+        for start in range(0, self._products, SEED_CHUNK_SIZE):
+            end = min(start + SEED_CHUNK_SIZE, self._products)
+            session.execute(
+                insert(Product),
+                [
+                    {
+                        "name": f"Product {index}",
+                        "price": round(self._random.uniform(1, 5000), 2),
+                        "supplier": f"Supplier {index % 50}",
+                        "category": f"Category {index % 20}",
+                        "description": "Benchmark product",
+                        "available_stock": 1000000,
+                    }
+                    for index in range(start, end)
+                ],
+            )
+
+        for start in range(0, self._sales, SEED_CHUNK_SIZE):
+            end = min(start + SEED_CHUNK_SIZE, self._sales)
+            session.execute(
+                insert(Sales),
+                [
+                    {
+                        "name": self._random_product(),
+                        "quantity": 1,
+                        "value": 10.0,
+                        "sale_status": self._random.choice(["Open", "Closed"]),
+                        "sale_date": datetime.today(),
+                        "zip_code": "01025-020",
+                        "country": "Brazil",
+                        "city": "Sao Paulo",
+                        "state": "Sp",
+                        "street": "Avenida Do Estado",
+                        "neighborhood": "",
+                    }
+                    for _ in range(start, end)
+                ],
+            )
+
+        session.commit()
+        backfill_sale_categories()
+        backfill_sales_summary()
+
+        self._open_sales = [
+            sales_id
+            for (sales_id,) in session.query(Sales.sales_id)
+            .filter(Sales.sale_status == "Open")
+            .all()
+        ]
+        self._random.shuffle(self._open_sales)
+        database.remove_session()
+
+        if len(self._open_sales) < 2 * self._requests:
+            raise ValueError("Not enough open sales seeded, increase --sales")
+
+    def _random_product(self) -> str:
+        """Method to pick a seeded product"""
+        return f"Product {self._random.randrange(self._products)}"
+
+    def _sale_form(self) -> dict:
+        """Method to build the form of a new sale"""
+        return {
+            "name": self._random_product(),
+            "quantity": 1,
+            "zip_code": "01025-020",
+            "country": "Brazil",
+            "city": "Sao Paulo",
+            "state": "SP",
+            "street": "Avenida do Estado",
+            "neighborhood": "",
+        }
+
+    def _route_calls(self) -> dict:
+        """Method to return how each route is called"""
+        client = self._client
+
+        return {
+            "add_product": lambda index: client.post(
+                "/add_product",
+                data={
+                    "name": f"New Product {index}",
+                    "price": 10.0,
+                    "supplier": "Benchmark",
+                    "category": "Benchmark",
+                    "description": "Benchmark product",
+                    "available_stock": 10,
+                },
+            ),
+            "add_sale": lambda index: client.post(
+                "/add_sale", data=self._sale_form()
+            ),
+            "get_product": lambda index: client.get(
+                "/get_product/", query_string={"name": self._random_product()}
+            ),
+            "get_sales": lambda index: client.get("/get_sales"),
+            "close_sale": lambda index: client.put(
+                "/close_sale", data={"sales_id": self._open_sales.pop()}
+            ),
+            "delete_sale": lambda index: client.delete(
+                "/delete_sale", data={"sales_id": self._open_sales.pop()}
+            ),
+            "sales_report": lambda index: client.get(
+                "/sales_report", query_string={"group_by": "category"}
+            ),
+        }
+
+    def _percentile(self, latencies: list, percentile: float) -> float:
+        """Method to return a nearest-rank percentile"""
+        rank = max(int(round(percentile / 100 * len(latencies))) - 1, 0)
+
+        return latencies[rank]
+
+    def run_route(self, call) -> dict:
+        """Method to measure a single route"""
+        latencies = []
+        status_codes = {}
+        self._queries = 0
+        started = time.perf_counter()
+
+        for index in range(self._requests):
+            request_started = time.perf_counter()
+            response = call(index)
+            latencies.append((time.perf_counter() - request_started) * 1000)
+
+            status_code = str(response.status_code)
+            status_codes[status_code] = status_codes.get(status_code, 0) + 1
+
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+
+        return {
+            "requests": self._requests,
+            "status_codes": status_codes,
+            "p50_ms": round(self._percentile(latencies, 50), 3),
+            "p95_ms": round(self._percentile(latencies, 95), 3),
+            "p99_ms": round(self._percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "requests_per_second": round(self._requests / elapsed, 2),
+            "queries_per_request": round(self._queries / self._requests, 2),
+        }
+
+    def run(self, routes: list) -> dict:
+        """Method to measure the chosen routes"""
+        route_calls = self._route_calls()
+        results = {}
+
+        for route in routes:
+            results[route] = self.run_route(route_calls[route])
+
+            print(
+                f"{route:<12} p50 {results[route]['p50_ms']:>9.3f} ms"
+                f"  p95 {results[route]['p95_ms']:>9.3f} ms"
+                f"  p99 {results[route]['p99_ms']:>9.3f} ms"
+                f"  {results[route]['requests_per_second']:>9.2f} req/s"
+                f"  {results[route]['queries_per_request']:>6.2f} queries/req"
+            )
+
+        return results
+
+
+def main() -> None:
+    """Runs the benchmark from the command line."""
+    routes = [
+        "add_product",
+        "add_sale",
+        "get_product",
+        "get_sales",
+        "close_sale",
+        "delete_sale",
+        "sales_report",
+    ]
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--sales", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--routes", nargs="+", choices=routes, default=routes)
+    parser.add_argument("--label", default="", help="e.g. the commit hash")
+    parser.add_argument("--output", help="JSON file for the results")
+    arguments = parser.parse_args()
+
+    benchmark = Benchmark(
+        products=arguments.products,
+        sales=arguments.sales,
+        requests=arguments.requests,
+        seed=arguments.seed,
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        benchmark.setup(directory)
+
+        seed_started = time.perf_counter()
+        benchmark.seed()
+
+        print(
+            f"Seeded {arguments.products} products and {arguments.sales} "
+            f"sales in {time.perf_counter() - seed_started:.1f} s"
+        )
+
+        results = {
+            "label": arguments.label,
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "products": arguments.products,
+            "sales": arguments.sales,
+            "requests": arguments.requests,
+            "seed": arguments.seed,
+            "routes": benchmark.run(arguments.routes),
+        }
+
+        from app import log
+
+        log.stop_log()
+
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
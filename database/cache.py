@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class Cache:
+    """Class for an in-process cache with expiration and LRU eviction"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @property
+    def stats(self) -> dict:
+        """Method to return the cache counters"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "ttl": self._ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+    def get(self, key: str):
+        """Method to return a cached value, or None if it is not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+            return entry[1]
+
+    def set(self, key: str, value, generation: int = None) -> None:
+        """
+        Method to cache a value. When a generation is informed, the value
+        is discarded if an invalidation happened since it was read.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        """Method to remove a value from the cache"""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def get_or_load(self, key: str, loader):
+        """Method to return a cached value, loading and caching it on a miss"""
+        value = self.get(key)
+
+        if value is not None:
+            return value
+
+        with self._lock:
+            generation = self._generation
+
+        value = loader()
+
+        if value is not None:
+            self.set(key, value, generation)
+
+        return value
@@ -1,50 +1,258 @@
 import os
+from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func, inspect, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy_utils import create_database, database_exists
 
 
+class ConflictError(Exception):
+    """Class for writes based on a version that was already changed"""
+
+
 class Database:
     """Class for general database settings"""
 
     DB_PATH = "database/database-file/online-store.sqlite3"
     BASE = declarative_base()
+    SESSION = scoped_session(sessionmaker())
+    POOL_SIZE = 5
+    MAX_OVERFLOW = 10
+    POOL_TIMEOUT = 30
+    POOL_RECYCLE = 1800
+    UPSERT_INSERTS = {
+        "postgresql": postgresql_insert,
+        "sqlite": sqlite_insert,
+    }
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    }
 
-    def __init__(self):
+    def __init__(
+        self,
+        database_url: str = None,
+        sqlite_pragmas: dict = None,
+        pool_size: int = POOL_SIZE,
+        max_overflow: int = MAX_OVERFLOW,
+        pool_timeout: int = POOL_TIMEOUT,
+        pool_recycle: int = POOL_RECYCLE,
+        pool_pre_ping: bool = True,
+    ):
         self._engine = None
-        self._session = None
+        self._database_url = make_url(
+            database_url or f"sqlite:///{self.DB_PATH}"
+        )
+        self._sqlite_pragmas = dict(self.SQLITE_PRAGMAS)
+        self._sqlite_pragmas.update(sqlite_pragmas or {})
+        self._pool_size = pool_size
+        self._max_overflow = max_overflow
+        self._pool_timeout = pool_timeout
+        self._pool_recycle = pool_recycle
+        self._pool_pre_ping = pool_pre_ping
+
+    @property
+    def _is_sqlite(self) -> bool:
+        """Method to check if the database is SQLite"""
+        return self._database_url.get_backend_name() == "sqlite"
+
+    @property
+    def _is_sqlite_memory(self) -> bool:
+        """Method to check if the database is an in-memory SQLite"""
+        return self._is_sqlite and self._database_url.database in (
+            None,
+            "",
+            ":memory:",
+        )
 
     def _create_database(self) -> None:
         """Database creation method"""
-        db_directory = os.path.join(os.getcwd(), "database", "database-file")
+        if self._is_sqlite and not self._is_sqlite_memory:
+            db_directory = os.path.dirname(
+                os.path.abspath(self._database_url.database)
+            )
 
-        if not os.path.isdir(db_directory):
-            os.makedirs(db_directory)
+            if not os.path.isdir(db_directory):
+                os.makedirs(db_directory)
 
         db_url = self._engine.url
 
-        if not database_exists(db_url):
+        if not self._is_sqlite_memory and not database_exists(db_url):
             create_database(db_url)
 
         self.BASE.metadata.create_all(self._engine)
+        self._migrate_database()
+
+    def _needs_sqlite_autoincrement(self, table: object) -> bool:
+        """
+        Method to check if a SQLite table should never reuse the ids
+        of deleted rows but was created without AUTOINCREMENT
+        """
+        if not self._is_sqlite or not table.dialect_options["sqlite"].get(
+            "autoincrement"
+        ):
+            return False
+
+        with self._engine.connect() as connection:
+            table_sql = connection.execute(
+                text(
+                    "SELECT sql FROM sqlite_master "
+                    "WHERE type = 'table' AND name = :name"
+                ),
+                {"name": table.name},
+            ).scalar()
+
+        return "AUTOINCREMENT" not in table_sql.upper()
+
+    def _rebuild_sqlite_table(
+        self, table: object, existing_columns: set
+    ) -> None:
+        """
+        Method to recreate a SQLite table from its model, keeping its
+        rows, since SQLite can not add AUTOINCREMENT to a table
+        """
+        preparer = self._engine.dialect.identifier_preparer
+        table_name = preparer.format_table(table)
+        old_table_name = preparer.quote(f"{table.name}_old")
+        copied_columns = ", ".join(
+            preparer.quote(column.name)
+            for column in table.columns
+            if column.name in existing_columns
+        )
+
+        with self._engine.begin() as connection:
+            connection.execute(
+                text(f"ALTER TABLE {table_name} RENAME TO {old_table_name}")
+            )
+
+            for index in table.indexes:
+                connection.execute(
+                    text(f"DROP INDEX IF EXISTS {preparer.quote(index.name)}")
+                )
+
+            table.create(connection)
+            connection.execute(
+                text(
+                    f"INSERT INTO {table_name} ({copied_columns}) "
+                    f"SELECT {copied_columns} FROM {old_table_name}"
+                )
+            )
+            connection.execute(text(f"DROP TABLE {old_table_name}"))
+
+    def _migrate_database(self) -> None:
+        """
+        Method to bring existing database files up to date,
+        create_all does not change tables that already exist
+        """
+        inspector = inspect(self._engine)
+        preparer = self._engine.dialect.identifier_preparer
+
+        for table in self.BASE.metadata.sorted_tables:
+            existing_columns = {
+                column["name"] for column in inspector.get_columns(table.name)
+            }
+
+            if self._needs_sqlite_autoincrement(table):
+                self._rebuild_sqlite_table(table, existing_columns)
+                continue
+
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                column_definition = CreateColumn(column).compile(
+                    dialect=self._engine.dialect
+                )
+
+                with self._engine.begin() as connection:
+                    connection.execute(
+                        text(
+                            f"ALTER TABLE {preparer.format_table(table)} "
+                            f"ADD COLUMN {column_definition}"
+                        )
+                    )
+
+            for index in table.indexes:
+                index.create(self._engine, checkfirst=True)
 
     def _create_engine(self) -> None:
         """Engine creation method"""
-        db_url = f"sqlite:///{self.DB_PATH}"
+        engine_settings = {
+            "poolclass": QueuePool,
+            "pool_size": self._pool_size,
+            "max_overflow": self._max_overflow,
+            "pool_timeout": self._pool_timeout,
+            "pool_recycle": self._pool_recycle,
+            "pool_pre_ping": self._pool_pre_ping,
+        }
+
+        if self._is_sqlite:
+            engine_settings["connect_args"] = {"check_same_thread": False}
+
+        # An in-memory database only lives as long as its connection,
+        # so every thread shares one: meant for local single-threaded use
+        if self._is_sqlite_memory:
+            engine_settings = {
+                "poolclass": StaticPool,
+                "connect_args": {"check_same_thread": False},
+            }
+
         self._engine = create_engine(
-            db_url, echo=False, connect_args={"check_same_thread": False}
+            self._database_url, echo=False, **engine_settings
         )
 
-    def _create_session(self) -> None:
-        """Method to create a session"""
-        session_maker = sessionmaker(bind=self._engine)
-        self._session = session_maker()
+        if self._is_sqlite:
+            event.listen(self._engine, "connect", self._set_sqlite_pragmas)
+
+        self.SESSION.configure(bind=self._engine)
 
-    def _close_session(self) -> None:
-        """Method to close a session"""
-        self._session.close()
+    def _set_sqlite_pragmas(self, dbapi_connection, connection_record) -> None:
+        """Method to apply the SQLite pragmas to each new connection"""
+        cursor = dbapi_connection.cursor()
+
+        for pragma, value in self._sqlite_pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+        cursor.close()
+
+    def _create_session(self):
+        """Method to get the session of the current request"""
+        return self.SESSION()
+
+    def _commit_session(self, session) -> None:
+        """Method to commit, unless a transaction block is open"""
+        if session.info.get("transaction_depth", 0) == 0:
+            session.commit()
+
+    def remove_session(self, exception: Exception = None) -> None:
+        """Method to close the session of the current request"""
+        self.SESSION.remove()
+
+    @contextmanager
+    def transaction(self):
+        """Method to group several operations in a single commit"""
+        session = self._create_session()
+        depth = session.info.get("transaction_depth", 0)
+        session.info["transaction_depth"] = depth + 1
+
+        try:
+            yield session
+            session.info["transaction_depth"] = depth
+            self._commit_session(session)
+        except Exception as error:
+            session.info["transaction_depth"] = depth
+            session.rollback()
+            raise error
 
     def _create_filter(self, filter_parameters: dict) -> list:
         desired_filter = [
@@ -53,86 +261,452 @@ class Database:
 
         return desired_filter
 
+    def _bump_version(self, table: object, new_data: dict) -> dict:
+        """
+        Method to add the increment of the version column to the data
+        of an update, for the tables that have a version column
+        """
+        version_column = getattr(table, "version", None)
+
+        if version_column is None:
+            return new_data
+
+        return {**new_data, version_column: version_column + 1}
+
+    def _versioned_filter(
+        self, table: object, filter_parameters: dict, expected_version: int
+    ) -> list:
+        """
+        Method to create a filter that only matches the rows still
+        at the expected version, when a version is expected
+        """
+        desired_filter = self._create_filter(filter_parameters)
+
+        if expected_version is not None:
+            desired_filter.append(table.version == expected_version)
+
+        return desired_filter
+
+    def _paginate_query(
+        self, query, key_columns: list, after: tuple, limit: int
+    ):
+        """Method to return a page of a query ordered by its key columns"""
+        if after is not None:
+            query = query.filter(tuple_(*key_columns) > tuple_(*after))
+
+        return query.order_by(*key_columns).limit(limit)
+
     def setup_database_environment(self) -> None:
         """Method to set up the database environment"""
         self._create_engine()
         self._create_database()
 
+    def setup_worker_environment(self) -> None:
+        """
+        Method to set up the database in a forked worker process,
+        without reusing the connections opened by the parent process
+        """
+        if self._engine is None:
+            self.setup_database_environment()
+            return
+
+        self._engine.dispose(close=False)
+        self.SESSION.remove()
+
+    def pool_status(self) -> dict:
+        """
+        Method to return the connections checked out of the pool and
+        the overflow in use, empty when the pool does not track them
+        """
+        if self._engine is None or not isinstance(
+            self._engine.pool, QueuePool
+        ):
+            return {}
+
+        return {
+            "checked_out": self._engine.pool.checkedout(),
+            "overflow": max(self._engine.pool.overflow(), 0),
+        }
+
     def insert_data_table(self, insert_data: object) -> None:
         """Method for inserting data into a table"""
-        self._create_session()
+        session = self._create_session()
 
         try:
-            self._session.add(insert_data)
-            self._session.commit()
+            session.add(insert_data)
+            self._commit_session(session)
         except Exception as error:
-            self._session.rollback()
+            session.rollback()
             raise error
-        finally:
-            self._close_session()
 
     def update_data_table(
-        self, table: object, filter_update: dict, new_data: dict
+        self,
+        table: object,
+        filter_update: dict,
+        new_data: dict,
+        expected_version: int = None,
     ) -> None:
-        """Method for update data of a table"""
-        self._create_session()
+        """
+        Method for update data of a table. With an expected version,
+        only rows still at that version are updated, and ConflictError
+        is raised when another request changed them first.
+        """
+        session = self._create_session()
 
         try:
-            desired_filter = self._create_filter(filter_update)
+            desired_filter = self._versioned_filter(
+                table, filter_update, expected_version
+            )
+
+            updated_rows = (
+                session.query(table)
+                .filter(*desired_filter)
+                .update(self._bump_version(table, new_data))
+            )
+
+            if expected_version is not None and updated_rows == 0:
+                raise ConflictError(
+                    f"The {table.__tablename__} was changed "
+                    "by another request, try again"
+                )
 
-            self._session.query(table).filter(*desired_filter).update(new_data)
-            self._session.commit()
+            self._commit_session(session)
         except Exception as error:
-            self._session.rollback()
+            session.rollback()
             raise error
-        finally:
-            self._close_session()
 
-    def delete_data_table(self, table: object, filter_delete: dict) -> None:
-        """Method for delete data of a table"""
-        self._create_session()
+    def insert_all_data_table(self, insert_data: list) -> None:
+        """
+        Method for inserting several rows at once, flushed right away
+        so their defaults are filled in before the commit
+        """
+        session = self._create_session()
 
         try:
-            desired_filter = self._create_filter(filter_delete)
+            session.add_all(insert_data)
+            session.flush()
+            self._commit_session(session)
+        except Exception as error:
+            session.rollback()
+            raise error
+
+    def reserve_stock_data_table(
+        self,
+        table: object,
+        key_column: object,
+        stock_column: object,
+        quantities: dict,
+        columns: list,
+    ) -> tuple:
+        """
+        Method to decrement stocks in a single transaction. Nothing is
+        decremented unless every stock is enough. Returns the keys whose
+        stock was not enough, and the columns of the reserved rows read
+        after the update, by key, so they can not change before the commit
+        """
+        with self.transaction() as session:
+            unavailable_keys = []
+
+            # Lock the rows in key order so concurrent reservations
+            # wait for each other instead of deadlocking
+            if not self._is_sqlite:
+                session.query(key_column).filter(
+                    key_column.in_(list(quantities))
+                ).order_by(key_column).with_for_update().all()
+
+            for key in sorted(quantities):
+                quantity = quantities[key]
+                reserved_rows = (
+                    session.query(table)
+                    .filter(key_column == key, stock_column >= quantity)
+                    .update(
+                        self._bump_version(
+                            table, {stock_column: stock_column - quantity}
+                        ),
+                        synchronize_session=False,
+                    )
+                )
+
+                if reserved_rows == 0:
+                    unavailable_keys.append(key)
+
+            if unavailable_keys:
+                session.rollback()
+                return unavailable_keys, {}
+
+            reserved_data = {
+                row[0]: row
+                for row in session.query(key_column, *columns).filter(
+                    key_column.in_(list(quantities))
+                )
+            }
+
+        return [], reserved_data
+
+    def upsert_data_table(
+        self, table: object, key_column: object, rows: list
+    ) -> tuple:
+        """
+        Method to insert rows in a single transaction, updating the ones
+        whose key already exists. Returns the inserted and updated counts.
+        """
+        with self.transaction() as session:
+            keys = [row[key_column.key] for row in rows]
+            updated_rows = (
+                session.query(func.count(key_column))
+                .filter(key_column.in_(keys))
+                .scalar()
+            )
+
+            dialect_name = self._engine.dialect.name
+
+            if dialect_name not in self.UPSERT_INSERTS:
+                raise Exception(f"Upsert is not supported on {dialect_name}")
+
+            statement = self.UPSERT_INSERTS[dialect_name](table).values(rows)
+            new_data = self._bump_version(
+                table,
+                {
+                    column: statement.excluded[column]
+                    for column in rows[0]
+                    if column != key_column.key
+                },
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=[key_column], set_=new_data
+            )
+            session.execute(statement)
+
+        return len(rows) - updated_rows, updated_rows
+
+    def increment_data_table(
+        self, table: object, key_columns: list, rows: list
+    ) -> None:
+        """
+        Method to add the values of rows to the rows with the same key,
+        inserting the keys that do not exist yet. Rows sharing a key
+        are merged first, a single statement can not update a row twice.
+        """
+        if len(rows) == 0:
+            return
+
+        key_names = [key_column.key for key_column in key_columns]
+        merged_rows = {}
+
+        for row in rows:
+            key = tuple(row[key_name] for key_name in key_names)
+            merged_row = merged_rows.get(key)
+
+            if merged_row is None:
+                merged_rows[key] = dict(row)
+                continue
+
+            for column, value in row.items():
+                if column not in key_names:
+                    merged_row[column] += value
+
+        with self.transaction() as session:
+            dialect_name = self._engine.dialect.name
+
+            if dialect_name not in self.UPSERT_INSERTS:
+                raise Exception(f"Upsert is not supported on {dialect_name}")
+
+            statement = self.UPSERT_INSERTS[dialect_name](table).values(
+                list(merged_rows.values())
+            )
+            new_data = {
+                column: getattr(table, column) + statement.excluded[column]
+                for column in rows[0]
+                if column not in key_names
+            }
+            statement = statement.on_conflict_do_update(
+                index_elements=key_columns, set_=new_data
+            )
+            session.execute(statement)
+
+    def delete_data_table(
+        self, table: object, filter_delete: dict, expected_version: int = None
+    ) -> None:
+        """
+        Method for delete data of a table. With an expected version,
+        only rows still at that version are deleted, and ConflictError
+        is raised when another request changed them first.
+        """
+        session = self._create_session()
+
+        try:
+            desired_filter = self._versioned_filter(
+                table, filter_delete, expected_version
+            )
 
-            self._session.query(table).filter(*desired_filter).delete()
-            self._session.commit()
+            deleted_rows = (
+                session.query(table).filter(*desired_filter).delete()
+            )
+
+            if expected_version is not None and deleted_rows == 0:
+                raise ConflictError(
+                    f"The {table.__tablename__} was changed "
+                    "by another request, try again"
+                )
+
+            self._commit_session(session)
         except Exception as error:
-            self._session.rollback()
+            session.rollback()
             raise error
-        finally:
-            self._close_session()
 
     def select_value_table_parameter(
         self, column: object, filter_select: dict
     ):
         """Method to query the value of a desired parameter"""
-        self._create_session()
+        session = self._create_session()
 
         try:
             desired_filter = self._create_filter(filter_select)
-            value = self._session.query(column).filter(*desired_filter).first()
+            value = session.query(column).filter(*desired_filter).first()
             value_fixed = "" if value is None else value[0]
         except Exception as error:
             value_fixed = error
             raise error
-        finally:
-            self._close_session()
 
         return value_fixed
 
+    def select_values_table_parameters(
+        self, columns: list, filter_select: dict
+    ):
+        """Method to query several values of the same row at once"""
+        session = self._create_session()
+        desired_filter = self._create_filter(filter_select)
+        row = session.query(*columns).filter(*desired_filter).first()
+
+        return row
+
+    def select_values_table_in(self, columns: list, filter_in: dict) -> list:
+        """Method to query several values of the rows matching any value"""
+        session = self._create_session()
+        desired_filter = [
+            column.in_(values) for column, values in filter_in.items()
+        ]
+        rows = session.query(*columns).filter(*desired_filter).all()
+
+        return rows
+
+    def select_first_data_table(self, table: object, filter_select: dict):
+        """Method to select the first row of a desired query"""
+        session = self._create_session()
+        desired_filter = self._create_filter(filter_select)
+        data = session.query(table).filter(*desired_filter).first()
+
+        return data
+
+    def select_page_data_table(
+        self,
+        table: object,
+        filter_select: dict,
+        conditions: list,
+        key_columns: list,
+        after: tuple = None,
+        limit: int = 100,
+        columns: list = None,
+    ) -> list:
+        """
+        Method to select a page of a table after the given key,
+        filtered by equality and by other conditions.
+        Only the given columns are selected when they are informed.
+        """
+        session = self._create_session()
+        desired_filter = self._create_filter(filter_select)
+        query = session.query(*(columns or [table])).filter(
+            *desired_filter, *conditions
+        )
+        data = self._paginate_query(query, key_columns, after, limit).all()
+
+        return data
+
+    def stream_data_table(
+        self,
+        columns: list,
+        filter_select: dict,
+        conditions: list,
+        key_columns: list,
+        batch_size: int = 1000,
+    ):
+        """
+        Method to yield the rows of a query one at a time, fetching
+        them in batches through a server side cursor where supported
+        """
+        session = self._create_session()
+        desired_filter = self._create_filter(filter_select)
+        query = (
+            session.query(*columns)
+            .filter(*desired_filter, *conditions)
+            .order_by(*key_columns)
+            .execution_options(yield_per=batch_size)
+        )
+
+        yield from query
+
     def select_data_table(self, table: object, filter_select: dict):
         """Method to select all data from a desired query"""
-        self._create_session()
+        session = self._create_session()
 
         try:
             desired_filter = self._create_filter(filter_select)
-            data = self._session.query(table).filter(*desired_filter).all()
+            data = session.query(table).filter(*desired_filter).all()
             data_fixed = "" if data is None else data
         except Exception as error:
             data_fixed = error
             raise error
-        finally:
-            self._close_session()
 
         return data_fixed
+
+    def select_grouped_data_table(
+        self,
+        columns: list,
+        aggregates: list,
+        filter_select: dict,
+        conditions: list,
+    ) -> list:
+        """
+        Method to select the aggregates of each group of columns,
+        ordered by the columns
+        """
+        session = self._create_session()
+        desired_filter = self._create_filter(filter_select)
+        data = (
+            session.query(*columns, *aggregates)
+            .filter(*desired_filter, *conditions)
+            .group_by(*columns)
+            .order_by(*columns)
+            .all()
+        )
+
+        return data
+
+    def select_join_data_table(
+        self,
+        tables: list,
+        join_table: object,
+        join_condition: object,
+        filter_select: dict,
+        key_columns: list = None,
+        after: tuple = None,
+        limit: int = None,
+    ) -> list:
+        """
+        Method to select data from tables joined in a single query,
+        a page after the given key when key columns are informed
+        """
+        session = self._create_session()
+        desired_filter = self._create_filter(filter_select)
+        query = (
+            session.query(*tables)
+            .outerjoin(join_table, join_condition)
+            .filter(*desired_filter)
+        )
+
+        if key_columns is not None:
+            query = self._paginate_query(query, key_columns, after, limit)
+
+        data = query.all()
+
+        return data
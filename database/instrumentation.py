@@ -0,0 +1,115 @@
+import time
+
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from log.log import Log
+
+
+class QueryInstrumentation:
+    """Class to count and time the SQL statements run by each request"""
+
+    def __init__(self, log: Log, slow_query_threshold: float = None):
+        self._log = log
+        self._slow_query_threshold = slow_query_threshold
+
+    def register(self, app: Flask) -> None:
+        """Method to attach the instrumentation to the engines and app"""
+        event.listen(
+            Engine, "before_cursor_execute", self._before_cursor_execute
+        )
+        event.listen(
+            Engine, "after_cursor_execute", self._after_cursor_execute
+        )
+        event.listen(Session, "after_begin", self._after_begin)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _is_measuring(self) -> bool:
+        """Method to check if the current request is being measured"""
+        return has_request_context() and "db_queries" in g
+
+    def _start_request(self) -> None:
+        """Method to reset the counters at the start of a request"""
+        g.db_queries = 0
+        g.db_sessions = 0
+        g.db_time = 0.0
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        """Method to record the start of a statement"""
+        conn.info.setdefault("query_start_time", []).append(
+            time.perf_counter()
+        )
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        """Method to record the duration of a statement"""
+        start_time = conn.info["query_start_time"].pop()
+        elapsed = (time.perf_counter() - start_time) * 1000
+
+        if not self._is_measuring():
+            return
+
+        g.db_queries += 1
+        g.db_time += elapsed
+
+        if (
+            self._slow_query_threshold is not None
+            and elapsed >= self._slow_query_threshold
+        ):
+            self._log.warning(
+                "Slow query on %s (%.2f ms): %s %s",
+                request.path,
+                elapsed,
+                statement,
+                parameters,
+                path=request.path,
+                duration_ms=round(elapsed, 2),
+            )
+
+    def _after_begin(self, session, transaction, connection) -> None:
+        """Method to count the sessions that reached the database"""
+        if self._is_measuring():
+            g.db_sessions += 1
+
+    def _finish_request(self, response):
+        """
+        Method to report the counters of the request. A streamed body
+        is generated after the headers are sent, so its counters are
+        logged once the stream is closed instead
+        """
+        if "db_queries" not in g:
+            return response
+
+        if response.is_streamed:
+            request_globals = g._get_current_object()
+            path = request.path
+
+            response.call_on_close(
+                lambda: self._log.debug(
+                    "Streamed %s: %s queries, %s sessions, %.2f ms",
+                    path,
+                    request_globals.db_queries,
+                    request_globals.db_sessions,
+                    request_globals.db_time,
+                    path=path,
+                    db_queries=request_globals.db_queries,
+                    db_sessions=request_globals.db_sessions,
+                    duration_ms=round(request_globals.db_time, 2),
+                )
+            )
+
+            return response
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={g.db_time:.2f};desc="{g.db_queries} queries, '
+            f'{g.db_sessions} sessions"',
+        )
+
+        return response
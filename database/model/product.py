@@ -9,14 +9,18 @@ class Product(BASE):
     """Class for creating the product table"""
 
     __tablename__ = "product"
+    __table_args__ = {"sqlite_autoincrement": True}
 
     product_id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(30), unique=True)
-    price = Column(Float)
-    supplier = Column(String(100))
-    category = Column(String(20))
+    price = Column(Float, index=True)
+    supplier = Column(String(100), index=True)
+    category = Column(String(20), index=True)
     description = Column(String(500))
     available_stock = Column(Integer)
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     def __init__(
         self,
@@ -33,3 +37,4 @@ class Product(BASE):
         self.category = category
         self.description = description
         self.available_stock = available_stock
+        self.version = 1
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Float, Integer, String, DateTime
+from sqlalchemy import Column, Float, Index, Integer, String, DateTime
 
 from database.database import Database
 
@@ -10,19 +10,26 @@ class Sales(BASE):
     """Class created for sold products"""
 
     __tablename__ = "sales"
+    __table_args__ = (
+        Index("ix_sales_sale_status_sales_id", "sale_status", "sales_id"),
+    )
 
     sales_id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(30))
+    name = Column(String(30), index=True)
     quantity = Column(Integer)
     value = Column(Float)
     sale_status = Column(String(10), default="Open")
-    sale_date = Column(DateTime, default=datetime.today())
+    sale_date = Column(DateTime, default=datetime.today, index=True)
     zip_code = Column(String(15))
     country = Column(String(50))
     city = Column(String(50))
     state = Column(String(50))
     street = Column(String(50))
     neighborhood = Column(String(20))
+    category = Column(String(20))
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     def __init__(
         self,
@@ -35,6 +42,7 @@ class Sales(BASE):
         state: str,
         street: str,
         neighborhood: str,
+        category: str = None,
     ):
         self.name = name
         self.quantity = quantity
@@ -45,3 +53,4 @@ class Sales(BASE):
         self.state = state
         self.street = street
         self.neighborhood = neighborhood
+        self.category = category
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Date, Float, Integer, String, UniqueConstraint
+
+from database.database import Database
+
+BASE = Database().BASE
+
+
+class SalesSummary(BASE):
+    """Class for the sales totals of each day, product, place and status"""
+
+    __tablename__ = "sales_summary"
+    __table_args__ = (
+        UniqueConstraint(
+            "day",
+            "name",
+            "category",
+            "state",
+            "country",
+            "sale_status",
+            name="uq_sales_summary_group",
+        ),
+    )
+
+    summary_id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, index=True)
+    name = Column(String(30))
+    category = Column(String(20))
+    state = Column(String(50))
+    country = Column(String(50))
+    sale_status = Column(String(10))
+    quantity = Column(Integer, default=0)
+    value = Column(Float, default=0)
+    sales_count = Column(Integer, default=0)
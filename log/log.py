@@ -1,4 +1,12 @@
+import atexit
+import gzip
+import json
 import os
+import queue
+import re
+import shutil
+import threading
+import time
 from datetime import datetime
 
 
@@ -6,22 +14,82 @@ class Log:
     """Class to configure log settings"""
 
     CURRENT_DATE = datetime.now()
+    FLUSH_SIZE = 100
+    FLUSH_INTERVAL = 1.0
+    LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+    FORMATS = ["text", "json"]
+    MAX_BYTES = 10485760
+    ROTATE_INTERVAL = 86400
+    RETENTION_FILES = 20
+    RETENTION_BYTES = 104857600
+    NAME_PATTERN = re.compile(r"^log_(\d{14})")
+    OWNER_PATTERN = re.compile(r"^log_\d{14}_(\d+)(?:_\d+)?\.txt$")
+    TEXT_RECORD_PATTERN = re.compile(
+        r"^(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})\|"
+    )
 
-    def __init__(self):
+    def __init__(
+        self,
+        level: str = "INFO",
+        log_format: str = "text",
+        max_bytes: int = MAX_BYTES,
+        rotate_interval: float = ROTATE_INTERVAL,
+        retention_files: int = RETENTION_FILES,
+        retention_bytes: int = RETENTION_BYTES,
+        log_directory: str = None,
+    ):
+        if level.upper() not in self.LEVELS:
+            raise ValueError(f"Unknown log level {level}")
+
+        if log_format.lower() not in self.FORMATS:
+            raise ValueError(f"Unknown log format {log_format}")
+
+        self._level = self.LEVELS[level.upper()]
+        self._format = log_format.lower()
         self._log_date = self.CURRENT_DATE.strftime("%d%m%Y%H%M%S")
-        self._log_name = f"log_{self._log_date}.txt"
-        self._log_directory = os.path.join(os.getcwd(), "log", "logs-files")
+        self._name_suffix = f"_{os.getpid()}"
+        self._log_name = f"log_{self._log_date}{self._name_suffix}.txt"
+        self._log_directory = log_directory or os.path.join(
+            os.getcwd(), "log", "logs-files"
+        )
         self._log_path = os.path.join(self._log_directory, self._log_name)
+        self._max_bytes = max_bytes
+        self._rotate_interval = rotate_interval
+        self._retention_files = retention_files
+        self._retention_bytes = retention_bytes
         self._status = False
+        self._is_worker = False
+        self._queue = queue.Queue()
+        self._writer = None
+        self._compress_queue = queue.Queue()
+        self._compressor = None
+        self._lock = threading.Lock()
+        self._exit_registered = False
+        self._cached_second = None
+        self._cached_date = ""
 
     def start_log(self) -> None:
         """Method to start the log file"""
-        if not os.path.isdir(self._log_directory):
-            os.makedirs(self._log_directory)
+        with self._lock:
+            if self._status is True:
+                return
+
+            if not os.path.isdir(self._log_directory):
+                os.makedirs(self._log_directory)
+
+            self._create_log_file(self.CURRENT_DATE)
+            self._start_writer()
+
+            if not self._is_worker:
+                self._compress_leftover_files()
 
-        access_date = self.CURRENT_DATE.strftime("%d/%m/%Y %H:%M:%S")
+            self._status = True
 
-        if not os.path.exists(self._log_path):
+    def _create_log_file(self, access: datetime) -> None:
+        """Method to create the current log file with its header"""
+        access_date = access.strftime("%d/%m/%Y %H:%M:%S")
+
+        if self._format == "text" and not os.path.exists(self._log_path):
             initial_content = [
                 f"{'*'*70}\n",
                 f"{'*'*1}{' '*22}Online Store Microservice{' '*21}{'*'*1}\n",
@@ -32,15 +100,404 @@ class Log:
             with open(self._log_path, "w") as log_file:
                 log_file.writelines(initial_content)
 
-        self._status = True
+    def _is_running(self, pid: int) -> bool:
+        """Method to check if a process is still running"""
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+        return True
+
+    def _compress_leftover_files(self) -> None:
+        """
+        Method to hand to the compressor the uncompressed log files left
+        by processes that are no longer running, such as the previous
+        run of the aplication. Only the main process does it, before
+        the workers start, so two processes never compress the same file
+        """
+        for entry in os.scandir(self._log_directory):
+            if not entry.name.endswith(".txt") or entry.path == self._log_path:
+                continue
+
+            owner = self.OWNER_PATTERN.match(entry.name)
+
+            if owner is not None:
+                owner_pid = int(owner.group(1))
+
+                if owner_pid != os.getpid() and self._is_running(owner_pid):
+                    continue
+
+            self._compress_queue.put(entry.path)
+
+    def _new_log_path(self, date: datetime) -> str:
+        """Method to return an unused path for a new log file"""
+        log_name = f"log_{date.strftime('%d%m%Y%H%M%S')}{self._name_suffix}"
+        log_path = os.path.join(self._log_directory, f"{log_name}.txt")
+        counter = 1
+
+        while os.path.exists(log_path) or os.path.exists(f"{log_path}.gz"):
+            log_path = os.path.join(
+                self._log_directory, f"{log_name}_{counter}.txt"
+            )
+            counter += 1
+
+        return log_path
+
+    def start_worker_log(self) -> None:
+        """
+        Method to start the log in a forked worker process,
+        the writer thread of the parent process does not exist there.
+        Each worker writes and rotates its own log file.
+        """
+        self._queue = queue.Queue()
+        self._writer = None
+        self._compress_queue = queue.Queue()
+        self._compressor = None
+        self._lock = threading.Lock()
+        self._status = False
+        self._is_worker = True
+        self._name_suffix = f"_{os.getpid()}"
+        self._log_path = self._new_log_path(datetime.now())
+        self.start_log()
+
+    def stop_log(self) -> None:
+        """Method to flush pending messages and stop the log writer"""
+        with self._lock:
+            if self._status is False:
+                return
+
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+            self._compress_queue.put(None)
+            self._compressor.join()
+            self._compressor = None
+            self._status = False
+
+    def _start_writer(self) -> None:
+        """
+        Method to start the thread that writes the log file
+        and the thread that compresses the rotated files
+        """
+        self._writer = threading.Thread(
+            target=self._write_messages, name="log-writer", daemon=True
+        )
+        self._writer.start()
+        self._compressor = threading.Thread(
+            target=self._compress_files, name="log-compressor", daemon=True
+        )
+        self._compressor.start()
+
+        if not self._exit_registered:
+            atexit.register(self.stop_log)
+            self._exit_registered = True
+
+    def _format_date(self, timestamp: float) -> str:
+        """Method to format a timestamp, reusing it within the same second"""
+        second = int(timestamp)
+
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_date = datetime.fromtimestamp(second).strftime(
+                "%d/%m/%Y %H:%M:%S"
+            )
+
+        return self._cached_date
+
+    def _format_record(self, entry: tuple) -> str:
+        """Method to format a queued record as a line of the log file"""
+        timestamp, level, message, args, fields = entry
+
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = f"{message} {args}"
+
+        if self._format == "json":
+            record = {
+                "time": datetime.fromtimestamp(timestamp).isoformat(
+                    timespec="milliseconds"
+                ),
+                "level": level,
+                "pid": os.getpid(),
+                "message": message,
+                **fields,
+            }
+
+            return f"{json.dumps(record, default=str)}\n"
+
+        date = self._format_date(timestamp)
+
+        if len(message) == 0:
+            return f"\n{date}| "
+
+        return f"\n{date}| {level}| {message}"
+
+    def _should_rotate(self, file_size: int, opened_at: float) -> bool:
+        """Method to check if the current log file is due for rotation"""
+        return (
+            file_size >= self._max_bytes
+            or time.time() - opened_at >= self._rotate_interval
+        )
+
+    def _rotate(self, log_file):
+        """
+        Method to close the current log file, hand it to the compressor
+        and return the new log file, called by the writer thread only
+        """
+        log_file.close()
+        self._compress_queue.put(self._log_path)
+
+        now = datetime.now()
+        self._log_path = self._new_log_path(now)
+        self._create_log_file(now)
+
+        return open(self._log_path, "a")
+
+    def _compress_files(self) -> None:
+        """Method to compress rotated log files and apply the retention"""
+        while True:
+            log_path = self._compress_queue.get()
+
+            if log_path is None:
+                break
+
+            try:
+                modified = os.path.getmtime(log_path)
+
+                with open(log_path, "rb") as source, gzip.open(
+                    f"{log_path}.gz", "wb"
+                ) as target:
+                    shutil.copyfileobj(source, target)
+
+                os.utime(f"{log_path}.gz", (modified, modified))
+                os.remove(log_path)
+                self._apply_retention()
+            except OSError:
+                continue
+
+    def _apply_retention(self) -> None:
+        """
+        Method to delete the oldest compressed log files beyond
+        the retained number of files or bytes. The uncompressed files,
+        still written or waiting for the compressor, count towards
+        the limits but are never deleted.
+        """
+        compressed_files = []
+        retained_files = 0
+        retained_bytes = 0
+
+        for entry in os.scandir(self._log_directory):
+            if self.NAME_PATTERN.match(entry.name) is None:
+                continue
+
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            if entry.name.endswith(".txt"):
+                retained_files += 1
+                retained_bytes += stat.st_size
+            elif entry.name.endswith(".gz"):
+                compressed_files.append((stat.st_mtime, stat.st_size, entry))
+
+        compressed_files.sort(key=lambda file: file[0], reverse=True)
+
+        for _, size, entry in compressed_files:
+            if (
+                retained_files < self._retention_files
+                and retained_bytes + size <= self._retention_bytes
+            ):
+                retained_files += 1
+                retained_bytes += size
+                continue
+
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+
+    def _write_messages(self) -> None:
+        """
+        Method to write queued messages, flushing them in batches
+        and rotating the log file when it is too large or too old
+        """
+        log_file = open(self._log_path, "a")
+        file_size = os.path.getsize(self._log_path)
+        opened_at = time.time()
+
+        try:
+            pending = 0
+            last_flush = time.monotonic()
+
+            while True:
+                timeout = None
+
+                if pending > 0:
+                    elapsed = time.monotonic() - last_flush
+                    timeout = max(self.FLUSH_INTERVAL - elapsed, 0)
+
+                try:
+                    entry = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    entry = ()
+
+                if entry is None:
+                    log_file.flush()
+                    break
+
+                if entry:
+                    line = self._format_record(entry)
+                    log_file.write(line)
+                    file_size += len(line)
+                    pending += 1
+
+                    if self._should_rotate(file_size, opened_at):
+                        log_file = self._rotate(log_file)
+                        file_size = os.path.getsize(self._log_path)
+                        opened_at = time.time()
+                        pending = 0
+                        last_flush = time.monotonic()
+
+                elapsed = time.monotonic() - last_flush
+
+                if pending >= self.FLUSH_SIZE or (
+                    pending > 0 and elapsed >= self.FLUSH_INTERVAL
+                ):
+                    log_file.flush()
+                    pending = 0
+                    last_flush = time.monotonic()
+        finally:
+            log_file.close()
+
+    @property
+    def queue_size(self) -> int:
+        """Method to return the number of messages waiting to be written"""
+        return self._queue.qsize()
+
+    def is_enabled(self, level: str) -> bool:
+        """Method to check if messages of a level are written"""
+        return self.LEVELS[level] >= self._level
+
+    def _add_record(
+        self, level: str, message: str, args: tuple, fields: dict
+    ) -> None:
+        """
+        Method to queue a record when its level is enabled. The message
+        is only formatted with its args by the writer thread, so
+        disabled records cost neither formatting nor serialization.
+        Empty messages separate requests in text logs and are skipped
+        in json logs.
+        """
+        if self.LEVELS[level] < self._level:
+            return
+
+        if self._format == "json" and len(message) == 0:
+            return
 
-    def add_message(self, message: str) -> None:
-        """Method to add a message to the log file"""
         if self._status is False:
             self.start_log()
 
-        date = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        self._queue.put((time.time(), level, message, args, fields))
+
+    def debug(self, message: str, *args, **fields) -> None:
+        """Method to add a debug message to the log file"""
+        self._add_record("DEBUG", message, args, fields)
+
+    def info(self, message: str, *args, **fields) -> None:
+        """Method to add an info message to the log file"""
+        self._add_record("INFO", message, args, fields)
+
+    def warning(self, message: str, *args, **fields) -> None:
+        """Method to add a warning message to the log file"""
+        self._add_record("WARNING", message, args, fields)
+
+    def error(self, message: str, *args, **fields) -> None:
+        """Method to add an error message to the log file"""
+        self._add_record("ERROR", message, args, fields)
+
+    def add_message(self, message: str) -> None:
+        """Method to add an info message to the log file"""
+        self.info(message)
+
+    def _read_record_date(self, line: str):
+        """Method to return the date of a record, None for other lines"""
+        text_record = self.TEXT_RECORD_PATTERN.match(line)
+
+        if text_record is not None:
+            return datetime.strptime(text_record.group(1), "%d/%m/%Y %H:%M:%S")
+
+        if line.startswith("{"):
+            try:
+                return datetime.fromisoformat(json.loads(line)["time"])
+            except (ValueError, KeyError, TypeError):
+                return None
+
+        return None
+
+    def _list_log_files(self, start: datetime, end: datetime) -> list:
+        """
+        Method to list the log files, rotated or not, that may hold
+        records between start and end, from the oldest to the newest
+        """
+        log_files = []
+
+        if not os.path.isdir(self._log_directory):
+            return log_files
+
+        for entry in os.scandir(self._log_directory):
+            name_date = self.NAME_PATTERN.match(entry.name)
+
+            if name_date is None or not entry.name.endswith((".txt", ".gz")):
+                continue
+
+            try:
+                modified = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+
+            created = datetime.strptime(name_date.group(1), "%d%m%Y%H%M%S")
+
+            if start is not None and modified < start.timestamp():
+                continue
+
+            if end is not None and created > end:
+                continue
+
+            log_files.append((modified, entry.path))
+
+        return [log_path for _, log_path in sorted(log_files)]
+
+    def read_logs(self, start: datetime = None, end: datetime = None):
+        """
+        Method to stream the lines of the log records written between
+        start and end, reading the rotated files one line at a time.
+        The lines that continue a record follow the record.
+        """
+        for log_path in self._list_log_files(start, end):
+            open_file = gzip.open if log_path.endswith(".gz") else open
+
+            try:
+                log_file = open_file(log_path, "rt")
+            except FileNotFoundError:
+                continue
+
+            with log_file:
+                in_range = False
+
+                for line in log_file:
+                    line = line.rstrip("\n")
+                    record_date = self._read_record_date(line)
+
+                    if record_date is not None:
+                        in_range = (
+                            start is None or record_date >= start
+                        ) and (end is None or record_date <= end)
 
-        with open(self._log_path, "a") as log_file:
-            new_content = f"\n{date}| {message}"
-            log_file.write(new_content)
+                    if in_range:
+                        yield line
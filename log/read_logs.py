@@ -0,0 +1,59 @@
+"""
+Prints the log records written in a time range, reading the current
+and the rotated log files from the oldest to the newest.
+
+    python log/read_logs.py --start "18/10/2026 10:00:00" \
+        --end "18/10/2026 11:00:00"
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+REPOSITORY_DIRECTORY = os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))
+)
+# The directory of this script would shadow the log package with log.py
+sys.path[0] = REPOSITORY_DIRECTORY
+
+from log.log import Log  # noqa: E402
+
+DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Reads the time range and the log directory from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Prints the log records written in a time range."
+    )
+    parser.add_argument(
+        "--start", help=f"Start of the range, formatted as {DATE_FORMAT}"
+    )
+    parser.add_argument(
+        "--end", help=f"End of the range, formatted as {DATE_FORMAT}"
+    )
+    parser.add_argument(
+        "--directory",
+        default=os.path.join(os.getcwd(), "log", "logs-files"),
+        help="Directory of the log files",
+    )
+
+    return parser.parse_args()
+
+
+def parse_date(value: str):
+    """Converts a command line date, None if it was not given."""
+    if value is None:
+        return None
+
+    return datetime.strptime(value, DATE_FORMAT)
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    log = Log(log_directory=arguments.directory)
+
+    for line in log.read_logs(
+        start=parse_date(arguments.start), end=parse_date(arguments.end)
+    ):
+        print(line)
@@ -1,14 +1,33 @@
 import resources.documentation
+import resources.metrics
 import resources.products
+import resources.reports
 import resources.sales
-from app import database, flask_settings, log
+from app import database, flask_settings, log, metrics
+from resources.reports import (
+    backfill_sale_categories,
+    backfill_sales_summary,
+)
+
+
+def start_worker() -> None:
+    """Prepares the database and the log of a forked worker."""
+    database.setup_worker_environment()
+    log.start_worker_log()
+    metrics.start_worker()
+
+    log.info("Worker started")
+
 
 if __name__ == "__main__":
     log.start_log()
 
-    log.add_message("Starting the database environment")
+    log.info("Starting the database environment")
     database.setup_database_environment()
+    backfill_sale_categories()
+    backfill_sales_summary()
+    metrics.clear_directory()
 
-    log.add_message("Starting Flask Settings")
-    log.add_message("")
-    flask_settings.run_aplication()
+    log.info("Starting Flask Settings")
+    log.info("")
+    flask_settings.run_aplication(on_worker_start=start_worker)
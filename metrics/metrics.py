@@ -0,0 +1,387 @@
+import itertools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from flask import Flask, g, request
+
+
+class Metrics:
+    """
+    Class to collect counters, histograms and gauges in the Prometheus
+    text format. Each thread records into one of a few shards, so
+    recording never waits on a lock shared by every request. With a
+    directory, each worker saves its metrics there and the export adds
+    up the metrics of every worker, whichever worker serves it.
+    """
+
+    SHARDS = 16
+    LATENCY_BUCKETS = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    )
+    FLUSH_INTERVAL = 5.0
+
+    def __init__(
+        self, directory: str = None, flush_interval: float = FLUSH_INTERVAL
+    ):
+        self._shards = [
+            {"lock": threading.Lock(), "counters": {}, "histograms": {}}
+            for _ in range(self.SHARDS)
+        ]
+        self._shard_counter = itertools.count()
+        self._local = threading.local()
+        self._descriptions = {}
+        self._gauges = {}
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self._snapshot_lock = threading.Lock()
+        self._flusher = None
+        self.route_tags = {}
+
+    def _get_shard(self) -> dict:
+        """Method to return the shard of the current thread"""
+        shard = getattr(self._local, "shard", None)
+
+        if shard is None:
+            shard_index = next(self._shard_counter) % self.SHARDS
+            shard = self._shards[shard_index]
+            self._local.shard = shard
+
+        return shard
+
+    def describe(self, name: str, metric_type: str, description: str) -> None:
+        """Method to set the type and help text of a metric"""
+        self._descriptions[name] = (metric_type, description)
+
+    def increment(
+        self, name: str, labels: tuple = (), value: float = 1
+    ) -> None:
+        """Method to increment a counter"""
+        shard = self._get_shard()
+        key = (name, labels)
+
+        with shard["lock"]:
+            counters = shard["counters"]
+            counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        """Method to record a value in a histogram"""
+        shard = self._get_shard()
+        key = (name, labels)
+        bucket_index = bisect_left(self.LATENCY_BUCKETS, value)
+
+        with shard["lock"]:
+            histogram = shard["histograms"].get(key)
+
+            if histogram is None:
+                histogram = [[0] * (len(self.LATENCY_BUCKETS) + 1), 0.0, 0]
+                shard["histograms"][key] = histogram
+
+            histogram[0][bucket_index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def register_gauge(
+        self, name: str, description: str, read_value: Callable
+    ) -> None:
+        """Method to register a gauge read only when metrics are exported"""
+        self.describe(name, "gauge", description)
+        self._gauges[name] = read_value
+
+    def register(self, app: Flask) -> None:
+        """Method to measure every request of the app"""
+        self.describe(
+            "http_requests_total", "counter", "Requests by route and status"
+        )
+        self.describe(
+            "http_request_errors_total",
+            "counter",
+            "Requests answered with an error status",
+        )
+        self.describe(
+            "http_request_duration_seconds",
+            "histogram",
+            "Request latency by route",
+        )
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start_request(self) -> None:
+        """Method to record the start of a request"""
+        g.metrics_start_time = time.perf_counter()
+
+    def _finish_request(self, response):
+        """Method to record the route, status and latency of a request"""
+        start_time = g.pop("metrics_start_time", None)
+
+        if start_time is None:
+            return response
+
+        route = "unmatched"
+
+        if request.url_rule is not None:
+            route = request.url_rule.rule
+
+        tag = self.route_tags.get(request.endpoint, "")
+        status = str(response.status_code)
+        route_labels = (
+            ("route", route),
+            ("method", request.method),
+            ("tag", tag),
+        )
+
+        self.increment(
+            "http_requests_total", route_labels + (("status", status),)
+        )
+
+        if response.status_code >= 400:
+            self.increment(
+                "http_request_errors_total",
+                route_labels + (("status", status),),
+            )
+
+        self.observe(
+            "http_request_duration_seconds",
+            route_labels,
+            time.perf_counter() - start_time,
+        )
+
+        return response
+
+    def _escape_label(self, value) -> str:
+        """Method to escape a label value"""
+        return (
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n")
+        )
+
+    def _format_labels(self, labels: tuple) -> str:
+        """Method to format the labels of a sample"""
+        if len(labels) == 0:
+            return ""
+
+        formatted_labels = ",".join(
+            f'{label}="{self._escape_label(value)}"' for label, value in labels
+        )
+
+        return f"{{{formatted_labels}}}"
+
+    def _merge_histogram(
+        self, histograms: dict, key: tuple, buckets: list, total, count
+    ) -> None:
+        """Method to add the buckets, sum and count of a histogram"""
+        merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+        merged[0] = [
+            merged_bucket + bucket
+            for merged_bucket, bucket in zip(merged[0], buckets)
+        ]
+        merged[1] += total
+        merged[2] += count
+
+    def _collect(self) -> tuple:
+        """Method to merge the counters and histograms of every shard"""
+        counters = {}
+        histograms = {}
+
+        for shard in self._shards:
+            with shard["lock"]:
+                shard_counters = list(shard["counters"].items())
+                shard_histograms = [
+                    (key, [list(buckets), total, count])
+                    for key, (buckets, total, count) in shard[
+                        "histograms"
+                    ].items()
+                ]
+
+            for key, value in shard_counters:
+                counters[key] = counters.get(key, 0) + value
+
+            for key, (buckets, total, count) in shard_histograms:
+                self._merge_histogram(histograms, key, buckets, total, count)
+
+        return counters, histograms
+
+    def _read_gauges(self) -> dict:
+        """Method to read the current value of every gauge"""
+        gauges = {}
+
+        for name, read_value in self._gauges.items():
+            value = read_value()
+
+            if value is not None:
+                gauges[name] = value
+
+        return gauges
+
+    def _is_snapshot(self, file_name: str) -> bool:
+        """Method to check if a file holds the metrics of a worker"""
+        return file_name.startswith("metrics_") and file_name.endswith(
+            ".json"
+        )
+
+    def _is_running(self, pid: int) -> bool:
+        """Method to check if a process is still running"""
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+        return True
+
+    def clear_directory(self) -> None:
+        """
+        Method to remove the metrics saved by a previous run,
+        called by the main process before the workers start
+        """
+        if self._directory is None:
+            return
+
+        os.makedirs(self._directory, exist_ok=True)
+
+        for entry in os.scandir(self._directory):
+            if self._is_snapshot(entry.name):
+                os.remove(entry.path)
+
+    def start_worker(self) -> None:
+        """
+        Method to start saving the metrics of a forked worker
+        to the directory shared by the workers
+        """
+        if self._directory is None:
+            return
+
+        self._flusher = threading.Thread(
+            target=self._flush_snapshots, name="metrics-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    def _flush_snapshots(self) -> None:
+        """Method to save the metrics of the worker at every interval"""
+        while True:
+            time.sleep(self._flush_interval)
+
+            try:
+                self._write_snapshot()
+            except OSError:
+                continue
+
+    def _write_snapshot(self) -> None:
+        """
+        Method to save the metrics of this process to its file, replacing
+        it at once so other workers never read a partial file
+        """
+        counters, histograms = self._collect()
+        snapshot = {
+            "pid": os.getpid(),
+            "counters": [
+                [name, labels, value]
+                for (name, labels), value in counters.items()
+            ],
+            "histograms": [
+                [name, labels, buckets, total, count]
+                for (name, labels), (buckets, total, count) in (
+                    histograms.items()
+                )
+            ],
+            "gauges": self._read_gauges(),
+        }
+        snapshot_path = os.path.join(
+            self._directory, f"metrics_{os.getpid()}.json"
+        )
+
+        with self._snapshot_lock:
+            with open(f"{snapshot_path}.tmp", "w") as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+
+            os.replace(f"{snapshot_path}.tmp", snapshot_path)
+
+    def _read_snapshots(self) -> tuple:
+        """
+        Method to add up the metrics saved by every worker. The counters
+        and histograms of stopped workers are kept so the totals never
+        go down, their gauges are left out.
+        """
+        counters = {}
+        histograms = {}
+        gauges = {}
+
+        for entry in os.scandir(self._directory):
+            if not self._is_snapshot(entry.name):
+                continue
+
+            try:
+                with open(entry.path) as snapshot_file:
+                    snapshot = json.load(snapshot_file)
+            except (OSError, ValueError):
+                continue
+
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+
+            for name, labels, buckets, total, count in snapshot[
+                "histograms"
+            ]:
+                key = (name, tuple(tuple(label) for label in labels))
+                self._merge_histogram(histograms, key, buckets, total, count)
+
+            if self._is_running(snapshot["pid"]):
+                for name, value in snapshot["gauges"].items():
+                    gauges[name] = gauges.get(name, 0) + value
+
+        return counters, histograms, gauges
+
+    def export(self) -> str:
+        """Method to return every metric in the Prometheus text format"""
+        if self._directory is None:
+            counters, histograms = self._collect()
+            gauges = self._read_gauges()
+        else:
+            self._write_snapshot()
+            counters, histograms, gauges = self._read_snapshots()
+
+        samples = {}
+
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append(
+                f"{name}{self._format_labels(labels)} {value}"
+            )
+
+        for (name, labels), (buckets, total, count) in histograms.items():
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+
+            bounds = self.LATENCY_BUCKETS + ("+Inf",)
+
+            for bound, bucket in zip(bounds, buckets):
+                cumulative += bucket
+                bucket_labels = labels + (("le", bound),)
+                lines.append(
+                    f"{name}_bucket{self._format_labels(bucket_labels)} "
+                    f"{cumulative}"
+                )
+
+            lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+
+        for name, value in gauges.items():
+            samples[name] = [f"{name} {value}"]
+
+        output = []
+
+        for name in sorted(samples):
+            metric_type, description = self._descriptions.get(
+                name, ("untyped", "")
+            )
+            output.append(f"# HELP {name} {description}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(samples[name])
+
+        return "\n".join(output) + "\n"
@@ -15,7 +15,7 @@ def documentation_route():
     Redirects to the /openapi route,\
     a screen that allows choosing the documentation style.
     """
-    log.add_message("Documentation accessed")
-    log.add_message("")
+    log.info("Documentation accessed")
+    log.info("")
 
     return redirect("/openapi")
@@ -0,0 +1,32 @@
+from flask import Response
+from flask_openapi3 import Tag
+
+from app import app, metrics
+from resources.documentation import TAG_DOCUMENTATION
+from resources.products import TAG_PRODUCTS
+from resources.reports import TAG_REPORTS
+from resources.sales import TAG_SALES
+
+TAG_METRICS = Tag(name="Metrics", description="Application metrics routes.")
+
+MODULE_TAGS = {
+    "resources.documentation": TAG_DOCUMENTATION.name,
+    "resources.products": TAG_PRODUCTS.name,
+    "resources.reports": TAG_REPORTS.name,
+    "resources.sales": TAG_SALES.name,
+    __name__: TAG_METRICS.name,
+}
+
+
+@app.get("/metrics", tags=[TAG_METRICS])
+def metrics_route():
+    """
+    Returns the request, sales, stock, database pool and log metrics,\
+    in the Prometheus text format.
+    """
+    return Response(metrics.export(), mimetype="text/plain; version=0.0.4")
+
+
+for endpoint, view_function in app.view_functions.items():
+    if view_function.__module__ in MODULE_TAGS:
+        metrics.route_tags[endpoint] = MODULE_TAGS[view_function.__module__]
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import threading
+
+import httpx
+
+
+class ProductService:
+    """Class to fetch product data from a separate product service"""
+
+    def __init__(
+        self, base_url: str, max_concurrency: int = 10, timeout: float = 2.0
+    ):
+        self._base_url = base_url.rstrip("/")
+        self._max_concurrency = max_concurrency
+        self._timeout = timeout
+        self._loop = None
+        self._loop_pid = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Method to check if a product service was configured"""
+        return len(self._base_url) > 0
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Method to return the event loop that runs the requests,
+        started once per process in a background thread
+        """
+        with self._lock:
+            if self._loop is None or self._loop_pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._loop_pid = os.getpid()
+                self._client = None
+
+                loop_thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="product-service",
+                    daemon=True,
+                )
+                loop_thread.start()
+
+            return self._loop
+
+    async def _fetch_product(
+        self, semaphore: asyncio.Semaphore, name: str
+    ) -> tuple:
+        """Method to fetch a single product, None if it is not available"""
+        async with semaphore:
+            try:
+                response = await self._client.get(
+                    "/get_product/",
+                    params={"name": name},
+                    timeout=self._timeout,
+                )
+            except httpx.HTTPError:
+                return name, None
+
+        if response.status_code != 200:
+            return name, None
+
+        return name, response.json().get("product")
+
+    async def _fetch_products(self, names: list) -> dict:
+        """Method to fetch several products concurrently"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self._base_url,
+                limits=httpx.Limits(max_connections=self._max_concurrency),
+            )
+
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+        results = await asyncio.gather(
+            *[self._fetch_product(semaphore, name) for name in names]
+        )
+
+        return {name: product for name, product in results if product}
+
+    def fetch_products(self, names: list) -> dict:
+        """
+        Method to fetch the distinct products of a list of names,
+        returns the product data of each name that was found
+        """
+        distinct_names = list(dict.fromkeys(names))
+
+        if len(distinct_names) == 0:
+            return {}
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._fetch_products(distinct_names), self._get_loop()
+        )
+
+        return future.result()
@@ -1,20 +1,185 @@
+import base64
+import csv
+import hashlib
+import json
+from typing import Iterable
 from urllib.parse import unquote
+
+from flask import request
 from flask_openapi3 import Tag
+from pydantic import ValidationError
+from sqlalchemy import exists
 
-from app import app, database, log
+from app import app, database, log, product_cache
+from database.database import ConflictError
 from database.model.product import Product
 from database.model.sales import Sales
 from schemas.products import (
     AddProductSchema,
+    ImportProductsSchema,
+    MessageImportProductsSchema,
+    MessageProductCacheSchema,
     MessageProductSchema,
+    ProductListResponseSchema,
+    ProductListSchema,
     ProductNameSchema,
+    ProductRowSchema,
     SingleMessageSchema,
     UpdateProductSchema,
     format_product_response,
+    format_product_row,
     format_update_product_response,
 )
 
 TAG_PRODUCTS = Tag(name="Product", description="Product data control routes.")
+IMPORT_CHUNK_SIZE = 500
+CACHE_CONTROL = "public, max-age=0, must-revalidate"
+SORT_KEY_COLUMNS = {
+    "name": [Product.name],
+    "price": [Product.price, Product.product_id],
+}
+
+
+def get_product_entry(name: str):
+    """
+    Returns the id, ETag and formatted data of a product, or None
+    if it does not exist, reading through the product cache.
+    The cache of each worker may predate a write handled by another
+    worker, so a cached product is only used at its current version.
+    """
+
+    def load_product():
+        product = database.select_values_table_parameters(
+            columns=format_product_row.columns + [Product.product_id],
+            filter_select={Product.name: name},
+        )
+
+        if product is None:
+            return None
+
+        product_data = format_product_row(product)
+        etag = _content_etag(
+            [product.product_id, product.version, product_data]
+        )
+
+        return product.product_id, etag, product_data
+
+    current_product = database.select_values_table_parameters(
+        columns=[Product.product_id, Product.version],
+        filter_select={Product.name: name},
+    )
+
+    if current_product is None:
+        product_cache.invalidate(name)
+        return None
+
+    product_entry = product_cache.get_or_load(name, load_product)
+
+    if product_entry is None or (
+        product_entry[0],
+        product_entry[2]["version"],
+    ) != tuple(current_product):
+        product_cache.invalidate(name)
+        product_entry = product_cache.get_or_load(name, load_product)
+
+    return product_entry
+
+
+def get_product_data(name: str):
+    """
+    Returns the formatted data of a product, or None if it does not exist,
+    reading through the product cache.
+    """
+    product_entry = get_product_entry(name)
+
+    return None if product_entry is None else product_entry[2]
+
+
+def _content_etag(content) -> str:
+    """
+    Returns a tag that changes with any change of the content, so it
+    does not repeat when a deleted row id is reused for other data.
+    """
+    return hashlib.sha1(
+        json.dumps(content, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def _cache_headers(etag: str) -> dict:
+    """Returns the headers that let clients revalidate a response."""
+    return {"ETag": f'"{etag}"', "Cache-Control": CACHE_CONTROL}
+
+
+def _is_not_modified(etag: str) -> bool:
+    """Checks if the client already has the response with the etag."""
+    return request.if_none_match.contains_weak(etag)
+
+
+def _encode_cursor(values: list) -> str:
+    """Encodes the key of the last listed product as a cursor."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _decode_cursor(cursor: str, key_size: int) -> tuple:
+    """Decodes a cursor into the key of the last listed product."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+
+    if not isinstance(values, list) or len(values) != key_size:
+        raise Exception("Invalid cursor")
+
+    return tuple(values)
+
+
+def _decode_lines(stream: Iterable[bytes]):
+    """
+    Yields the lines of the request body as text. The stream is only
+    iterated, since gunicorn hands over a body that is not a file object.
+    """
+    for line in stream:
+        yield line.decode("utf-8")
+
+
+def _read_import_rows(stream: Iterable[bytes], file_format: str):
+    """
+    Yields the products of an import one at a time,
+    or None for each line that can not be parsed.
+    """
+    text_stream = _decode_lines(stream)
+
+    if file_format == "csv":
+        yield from csv.DictReader(text_stream)
+        return
+
+    for line in text_stream:
+        if len(line.strip()) == 0:
+            continue
+
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def _format_import_row(row: dict) -> dict:
+    """Validates and normalizes a product of an import."""
+    product = ProductRowSchema(**row)
+
+    formatted_row = {
+        "name": product.name.strip().title(),
+        "price": round(product.price, 2),
+        "supplier": product.supplier.strip().title(),
+        "category": product.category.strip().title(),
+        "description": product.description.strip(),
+        "available_stock": product.available_stock,
+    }
+
+    if len(formatted_row["name"]) == 0:
+        raise ValueError("Product name not given")
+
+    return formatted_row
 
 
 @app.post(
@@ -27,7 +192,7 @@ TAG_PRODUCTS = Tag(name="Product", description="Product data control routes.")
 )
 def add_product(form: AddProductSchema):
     """Add a new product to the product table."""
-    log.add_message("Add_procuct route accessed")
+    log.debug("Add_procuct route accessed")
 
     name = unquote(unquote(form.name)).strip().title()
     price = round(form.price, 2)
@@ -41,12 +206,12 @@ def add_product(form: AddProductSchema):
             column=Product.name, filter_select={Product.name: name}
         )
 
-        log.add_message(f"Checking if the {name} product exists")
+        log.debug("Checking if the %s product exists", name)
 
         if len(registered_product) > 0:
             raise Exception("Product already registered")
 
-        log.add_message(f"{name} product does not exist")
+        log.debug("%s product does not exist", name)
 
         new_product = Product(
             name=name,
@@ -58,25 +223,102 @@ def add_product(form: AddProductSchema):
         )
         formatted_response = format_product_response(product=new_product)
         database.insert_data_table(new_product)
+        product_cache.invalidate(name)
 
-        log.add_message(f"{name} added")
+        log.debug("%s added", name)
 
         return_data = {
             "message": "Added Product",
             "product": formatted_response
         }
 
-        log.add_message(f"Add_procuct response: {return_data}")
-        log.add_message("Add_procuct status: 200")
-        log.add_message("")
+        log.debug("Add_procuct response: %s", return_data)
+        log.info("Add_procuct status: 200")
+        log.info("")
 
         return return_data, 200
     except Exception as error:
         return_data = {"message": f"Error: {error}"}
 
-        log.add_message(f"Add_procuct response: {return_data}")
-        log.add_message("Add_procuct status: 400")
-        log.add_message("")
+        log.debug("Add_procuct response: %s", return_data)
+        log.warning("Add_procuct status: 400")
+        log.info("")
+
+        return return_data, 400
+
+
+@app.post(
+    "/import_products",
+    tags=[TAG_PRODUCTS],
+    responses={
+        "200": MessageImportProductsSchema,
+        "400": MessageImportProductsSchema,
+    },
+)
+def import_products(query: ImportProductsSchema):
+    """
+    Inserts or updates products streamed in the request body,
+    one JSON object per line (ndjson) or csv with a header.
+    """
+    log.debug("Import_products route accessed")
+
+    file_format = query.file_format.strip().lower()
+    counts = {"inserted": 0, "updated": 0, "rejected": 0}
+
+    def upsert_chunk(chunk: dict) -> None:
+        inserted, updated = database.upsert_data_table(
+            table=Product, key_column=Product.name, rows=list(chunk.values())
+        )
+
+        for name in chunk:
+            product_cache.invalidate(name)
+
+        counts["inserted"] += inserted
+        counts["updated"] += updated
+
+        log.debug("%s products imported", len(chunk))
+
+        chunk.clear()
+
+    try:
+        log.debug("Checking if the %s format is supported", file_format)
+
+        if file_format not in ["ndjson", "csv"]:
+            raise Exception("Unsupported format, expected ndjson or csv")
+
+        chunk = {}
+
+        for row in _read_import_rows(request.stream, file_format):
+            try:
+                formatted_row = _format_import_row(row)
+            except (TypeError, ValueError, ValidationError):
+                counts["rejected"] += 1
+                continue
+
+            if formatted_row["name"] in chunk:
+                counts["updated"] += 1
+
+            chunk[formatted_row["name"]] = formatted_row
+
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                upsert_chunk(chunk)
+
+        if chunk:
+            upsert_chunk(chunk)
+
+        return_data = {"message": "Imported products", **counts}
+
+        log.debug("Import_products response: %s", return_data)
+        log.info("Import_products status: 200")
+        log.info("")
+
+        return return_data, 200
+    except Exception as error:
+        return_data = {"message": f"Error: {error}", **counts}
+
+        log.debug("Import_products response: %s", return_data)
+        log.warning("Import_products status: 400")
+        log.info("")
 
         return return_data, 400
 
@@ -87,58 +329,79 @@ def add_product(form: AddProductSchema):
     responses={
         "200": MessageProductSchema,
         "400": SingleMessageSchema,
+        "409": SingleMessageSchema,
     },
 )
 def update_stock(form: UpdateProductSchema):
     """Updates the available stock of the specified product."""
-    log.add_message("Update_stock route accessed")
+    log.debug("Update_stock route accessed")
 
     name = unquote(unquote(form.name)).strip().title()
     new_stock = form.new_stock
 
     try:
-        registered_product = database.select_value_table_parameter(
-            column=Product.name, filter_select={Product.name: name}
+        registered_product = database.select_values_table_parameters(
+            columns=[Product.available_stock, Product.version],
+            filter_select={Product.name: name},
         )
 
-        log.add_message(f"Checking if the {name} product exists")
+        log.debug("Checking if the %s product exists", name)
 
-        if len(registered_product) == 0:
+        if registered_product is None:
             raise Exception("The product does not exist")
 
-        log.add_message(f"{name} product exists")
+        log.debug("%s product exists", name)
+        log.debug("Checking the version of the %s product", name)
 
-        old_stock = database.select_value_table_parameter(
-            column=Product.available_stock, filter_select={Product.name: name}
-        )
+        if form.expected_version not in [None, registered_product.version]:
+            raise ConflictError(
+                f"The product is at version {registered_product.version}, "
+                f"expected {form.expected_version}"
+            )
+
+        old_stock = registered_product.available_stock
         formatted_response = format_update_product_response(
-            name=name, old_stock=old_stock, new_stock=new_stock
+            name=name,
+            old_stock=old_stock,
+            new_stock=new_stock,
+            version=registered_product.version + 1,
         )
 
         database.update_data_table(
             table=Product,
             filter_update={Product.name: name},
             new_data={Product.available_stock: new_stock},
+            expected_version=registered_product.version,
         )
+        product_cache.invalidate(name)
 
-        log.add_message(f"Updated {name} stock to {new_stock}")
+        log.debug("Updated %s stock to %s", name, new_stock)
 
         return_data = {
             "message": "Updated stock",
             "product": formatted_response
         }
 
-        log.add_message(f"Update_stock response: {return_data}")
-        log.add_message("Update_stock status: 200")
-        log.add_message("")
+        log.debug("Update_stock response: %s", return_data)
+        log.info("Update_stock status: 200")
+        log.info("")
 
         return return_data, 200
+    except ConflictError as error:
+        product_cache.invalidate(name)
+        return_data = {"message": f"Error: {error}"}
+
+        log.debug("Update_stock response: %s", return_data)
+        log.warning("Update_stock status: 409")
+        log.info("")
+
+        return return_data, 409
     except Exception as error:
         return_data = {"message": f"Error: {error}"}
 
-        log.add_message(f"Update_stock response: {return_data}")
-        log.add_message("Update_stock status: 400")
-        log.add_message("")
+        log.debug("Update_stock response: %s", return_data)
+        log.warning("Update_stock status: 400")
+        log.info("")
 
         return return_data, 400
 
@@ -149,59 +412,71 @@ def update_stock(form: UpdateProductSchema):
     responses={
         "200": MessageProductSchema,
         "400": SingleMessageSchema,
+        "409": SingleMessageSchema,
     },
 )
 def delete_product(form: ProductNameSchema):
     """Delete a product from the product table."""
-    log.add_message("Delete_product route accessed")
+    log.debug("Delete_product route accessed")
 
     name = unquote(unquote(form.name)).strip().title()
 
     try:
-        registered_product = database.select_value_table_parameter(
-            column=Product.name, filter_select={Product.name: name}
+        registered_product = database.select_values_table_parameters(
+            columns=[
+                Product.name,
+                Product.version,
+                exists().where(Sales.name == Product.name).label("sold"),
+            ],
+            filter_select={Product.name: name},
         )
 
-        log.add_message(f"Checking if the {name} product exists")
+        log.debug("Checking if the %s product exists", name)
 
-        if len(registered_product) == 0:
+        if registered_product is None:
             raise Exception("The product does not exist")
 
-        log.add_message(f"{name} product exists")
-
-        product_sold = database.select_value_table_parameter(
-            column=Sales.name, filter_select={Sales.name: name}
-        )
-
-        log.add_message("Checking if the product has already been sold")
+        log.debug("%s product exists", name)
+        log.debug("Checking if the product has already been sold")
 
-        if len(product_sold) > 0:
+        if registered_product.sold:
             raise Exception(
                 f"{name} has already been sold, it's not possible to delete it"
             )
 
-        log.add_message("The product has not yet been sold")
+        log.debug("The product has not yet been sold")
 
         database.delete_data_table(
             table=Product,
             filter_delete={Product.name: name},
+            expected_version=registered_product.version,
         )
+        product_cache.invalidate(name)
 
-        log.add_message(f"{name} deleted")
+        log.debug("%s deleted", name)
 
         return_data = {"message": "Product deleted", "name": name}
 
-        log.add_message(f"Delete_product response: {return_data}")
-        log.add_message("Delete_product status: 200")
-        log.add_message("")
+        log.debug("Delete_product response: %s", return_data)
+        log.info("Delete_product status: 200")
+        log.info("")
 
         return return_data, 200
+    except ConflictError as error:
+        product_cache.invalidate(name)
+        return_data = {"message": f"Error: {error}"}
+
+        log.debug("Delete_product response: %s", return_data)
+        log.warning("Delete_product status: 409")
+        log.info("")
+
+        return return_data, 409
     except Exception as error:
         return_data = {"message": f"Error: {error}"}
 
-        log.add_message(f"Delete_product response: {return_data}")
-        log.add_message("Delete_product status: 400")
-        log.add_message("")
+        log.debug("Delete_product response: %s", return_data)
+        log.warning("Delete_product status: 400")
+        log.info("")
 
         return return_data, 400
 
@@ -211,51 +486,181 @@ def delete_product(form: ProductNameSchema):
     tags=[TAG_PRODUCTS],
     responses={
         "200": MessageProductSchema,
+        "304": None,
         "400": SingleMessageSchema,
     },
 )
 def get_product(query: ProductNameSchema):
     """Method to obtain data of registered products."""
-    log.add_message("Get_product route accessed")
+    log.debug("Get_product route accessed")
 
     name = unquote(unquote(query.name)).strip().title()
 
     try:
-        registered_product = database.select_value_table_parameter(
-            column=Product.name, filter_select={Product.name: name}
-        )
+        product_entry = get_product_entry(name)
 
-        log.add_message(f"Checking if the {name} product exists")
+        log.debug("Checking if the %s product exists", name)
 
-        if len(registered_product) == 0:
+        if product_entry is None:
             raise Exception("The product does not exist")
 
-        log.add_message(f"{name} product exists")
+        log.debug("%s product exists", name)
 
-        product_data = database.select_data_table(
-            table=Product,
-            filter_select={Product.name: name},
-        )[0]
+        _, etag, formatted_response = product_entry
+        headers = _cache_headers(etag)
+
+        if _is_not_modified(etag):
+            log.debug("%s product not modified", name)
+            log.info("Get_product status: 304")
+            log.info("")
 
-        log.add_message("Products listed")
+            return "", 304, headers
 
-        formatted_response = format_product_response(product_data)
+        log.debug("Products listed")
 
         return_data = {
             "message": "Product all data",
             "product": formatted_response
         }
 
-        log.add_message(f"Get_product response: {return_data}")
-        log.add_message("Get_product status: 200")
-        log.add_message("")
+        log.debug("Get_product response: %s", return_data)
+        log.info("Get_product status: 200")
+        log.info("")
 
-        return return_data, 200
+        return return_data, 200, headers
     except Exception as error:
         return_data = {"message": f"Error: {error}"}
 
-        log.add_message(f"Get_product response: {return_data}")
-        log.add_message("Get_product status: 400")
-        log.add_message("")
+        log.debug("Get_product response: %s", return_data)
+        log.warning("Get_product status: 400")
+        log.info("")
 
         return return_data, 400
+
+
+@app.get(
+    "/products",
+    tags=[TAG_PRODUCTS],
+    responses={
+        "200": ProductListResponseSchema,
+        "304": None,
+        "400": SingleMessageSchema,
+    },
+)
+def list_products(query: ProductListSchema):
+    """
+    Lists the registered products, a page at a time.
+    Pass the returned next_cursor as after to get the next page.
+    """
+    log.debug("List_products route accessed")
+
+    sort = query.sort.strip().lower()
+    filter_select = {}
+    conditions = []
+
+    if query.category is not None:
+        category = unquote(unquote(query.category)).strip().title()
+        filter_select[Product.category] = category
+
+    if query.supplier is not None:
+        supplier = unquote(unquote(query.supplier)).strip().title()
+        filter_select[Product.supplier] = supplier
+
+    if query.min_price is not None:
+        conditions.append(Product.price >= query.min_price)
+
+    if query.max_price is not None:
+        conditions.append(Product.price <= query.max_price)
+
+    if query.in_stock:
+        conditions.append(Product.available_stock > 0)
+
+    try:
+        log.debug("Checking if products can be sorted by %s", sort)
+
+        if sort not in SORT_KEY_COLUMNS:
+            raise Exception("Unsupported sort, expected name or price")
+
+        key_columns = SORT_KEY_COLUMNS[sort]
+        after = None
+
+        if query.after is not None:
+            after = _decode_cursor(query.after, len(key_columns))
+
+        products = database.select_page_data_table(
+            table=Product,
+            filter_select=filter_select,
+            conditions=conditions,
+            key_columns=key_columns,
+            after=after,
+            limit=query.limit + 1,
+            columns=format_product_row.columns + [Product.product_id],
+        )
+
+        next_cursor = None
+
+        if len(products) > query.limit:
+            products = products[:query.limit]
+            last_product = products[-1]
+            next_cursor = _encode_cursor(
+                [getattr(last_product, column.key) for column in key_columns]
+            )
+
+        formatted_products = [
+            format_product_row(product) for product in products
+        ]
+        versions = [
+            [product.product_id, product.version] for product in products
+        ]
+        etag = _content_etag([versions, formatted_products, next_cursor])
+        headers = _cache_headers(etag)
+
+        if _is_not_modified(etag):
+            log.debug("Products not modified")
+            log.info("List_products status: 304")
+            log.info("")
+
+            return "", 304, headers
+
+        log.debug("%s products listed", len(products))
+
+        return_data = {
+            "message": "Products listed",
+            "products": formatted_products,
+            "next_cursor": next_cursor,
+        }
+
+        log.debug("List_products response: %s", return_data)
+        log.info("List_products status: 200")
+        log.info("")
+
+        return return_data, 200, headers
+    except Exception as error:
+        return_data = {"message": f"Error: {error}"}
+
+        log.debug("List_products response: %s", return_data)
+        log.warning("List_products status: 400")
+        log.info("")
+
+        return return_data, 400
+
+
+@app.get(
+    "/product_cache",
+    tags=[TAG_PRODUCTS],
+    responses={"200": MessageProductCacheSchema},
+)
+def product_cache_stats():
+    """Returns the hit, miss and eviction counters of the product cache."""
+    log.debug("Product_cache route accessed")
+
+    return_data = {
+        "message": "Product cache statistics",
+        "cache": product_cache.stats,
+    }
+
+    log.debug("Product_cache response: %s", return_data)
+    log.info("Product_cache status: 200")
+    log.info("")
+
+    return return_data, 200
@@ -0,0 +1,185 @@
+from flask_openapi3 import Tag
+from sqlalchemy import Date, func, select
+
+from app import app, database, log
+from database.model.product import Product
+from database.model.sales import Sales
+from database.model.sales_summary import SalesSummary
+from schemas.reports import (
+    MessageSalesReportSchema,
+    SalesReportSchema,
+    format_report_row,
+)
+from schemas.sales import SingleMessageSchema
+
+TAG_REPORTS = Tag(name="Reports", description="Sales report routes.")
+SUMMARY_KEY_COLUMNS = [
+    SalesSummary.day,
+    SalesSummary.name,
+    SalesSummary.category,
+    SalesSummary.state,
+    SalesSummary.country,
+    SalesSummary.sale_status,
+]
+GROUP_BY_COLUMNS = {
+    "product": SalesSummary.name,
+    "category": SalesSummary.category,
+    "day": SalesSummary.day,
+    "state": SalesSummary.state,
+    "country": SalesSummary.country,
+}
+
+
+def update_sales_summary(sales: list, sale_status: str, sign: int) -> None:
+    """
+    Adds the sales to the summary of the given status, or removes them
+    with a negative sign. Called inside the transaction of the sales.
+    The category recorded on each sale is used, so a sale is always
+    removed from the group it was added to.
+    """
+    rows = [
+        {
+            "day": sale.sale_date.date(),
+            "name": sale.name,
+            "category": sale.category,
+            "state": sale.state,
+            "country": sale.country,
+            "sale_status": sale_status,
+            "quantity": sign * sale.quantity,
+            "value": sign * sale.value,
+            "sales_count": sign,
+        }
+        for sale in sales
+    ]
+
+    database.increment_data_table(
+        table=SalesSummary, key_columns=SUMMARY_KEY_COLUMNS, rows=rows
+    )
+
+
+def backfill_sale_categories() -> None:
+    """
+    Records the category of their product on the sales added
+    before sales kept their own category.
+    """
+    database.update_data_table(
+        table=Sales,
+        filter_update={Sales.category: None},
+        new_data={
+            Sales.category: select(Product.category)
+            .where(Product.name == Sales.name)
+            .scalar_subquery()
+        },
+    )
+
+
+def backfill_sales_summary() -> None:
+    """Builds the sales summary from the sales history when it is empty."""
+    if database.select_first_data_table(SalesSummary, {}) is not None:
+        return
+
+    log.info("Building the sales summary")
+
+    groups = database.select_grouped_data_table(
+        columns=[
+            func.date(Sales.sale_date, type_=Date).label("day"),
+            Sales.name,
+            Sales.category,
+            Sales.state,
+            Sales.country,
+            Sales.sale_status,
+        ],
+        aggregates=[
+            func.sum(Sales.quantity).label("quantity"),
+            func.sum(Sales.value).label("value"),
+            func.count(Sales.sales_id).label("sales_count"),
+        ],
+        filter_select={},
+        conditions=[],
+    )
+
+    database.increment_data_table(
+        table=SalesSummary,
+        key_columns=SUMMARY_KEY_COLUMNS,
+        rows=[dict(group._mapping) for group in groups],
+    )
+
+    log.info("Sales summary built with %s groups", len(groups))
+
+
+@app.get(
+    "/sales_report",
+    tags=[TAG_REPORTS],
+    responses={
+        "200": MessageSalesReportSchema,
+        "400": SingleMessageSchema,
+    },
+)
+def sales_report(query: SalesReportSchema):
+    """
+    Returns the quantity, value and number of sales of each product,\
+    category, day, state or country in a period.
+    """
+    log.debug("Sales_report route accessed")
+
+    group_by = query.group_by.strip().lower()
+    filter_select = {}
+    conditions = []
+
+    if query.sale_status is not None:
+        filter_select[SalesSummary.sale_status] = (
+            query.sale_status.strip().title()
+        )
+
+    if query.start_date is not None:
+        conditions.append(SalesSummary.day >= query.start_date)
+
+    if query.end_date is not None:
+        conditions.append(SalesSummary.day <= query.end_date)
+
+    try:
+        log.debug("Checking if sales can be grouped by %s", group_by)
+
+        if group_by not in GROUP_BY_COLUMNS:
+            raise Exception(
+                "Unsupported group, expected product, category, day, "
+                "state or country"
+            )
+
+        groups = database.select_grouped_data_table(
+            columns=[GROUP_BY_COLUMNS[group_by]],
+            aggregates=[
+                func.sum(SalesSummary.quantity).label("quantity"),
+                func.sum(SalesSummary.value).label("value"),
+                func.sum(SalesSummary.sales_count).label("sales_count"),
+            ],
+            filter_select=filter_select,
+            conditions=conditions,
+        )
+        rows = [
+            format_report_row(group=group[0], row=group)
+            for group in groups
+            if group.sales_count > 0
+        ]
+
+        log.debug("%s groups reported", len(rows))
+
+        return_data = {
+            "message": "Sales report",
+            "group_by": group_by,
+            "rows": rows,
+        }
+
+        log.debug("Sales_report response: %s", return_data)
+        log.info("Sales_report status: 200")
+        log.info("")
+
+        return return_data, 200
+    except Exception as error:
+        return_data = {"message": f"Error: {error}"}
+
+        log.debug("Sales_report response: %s", return_data)
+        log.warning("Sales_report status: 400")
+        log.info("")
+
+        return return_data, 400
@@ -1,23 +1,222 @@
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
 from urllib.parse import unquote
 
-import requests
+from flask import Response, stream_with_context
 from flask_openapi3 import Tag
 
-from app import app, database, log
+from app import app, database, log, metrics, product_cache, product_service
+from database.database import ConflictError
 from database.model.product import Product
 from database.model.sales import Sales
-from resources.products import update_stock
-from schemas.products import UpdateProductSchema
+from resources.products import get_product_data
+from resources.reports import update_sales_summary
 from schemas.sales import (
+    AddSalesListSchema,
     AddSalesSchema,
     CloseSaleSchema,
+    ExportSalesSchema,
+    MessageBulkSalesSchema,
     MessageSalesSchema,
     SaleResponseSchema,
+    SalesPageSchema,
     SingleMessageSchema,
     format_add_sale_response,
+    format_export_row,
+    format_sale_product_row,
+    format_sale_row,
 )
 
 TAG_SALES = Tag(name="Sales", description="Sales data control routes.")
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = [
+    Sales.sales_id,
+    Sales.name,
+    Sales.quantity,
+    Sales.value,
+    Sales.sale_status,
+    Sales.sale_date,
+    Sales.zip_code,
+    Sales.country,
+    Sales.city,
+    Sales.state,
+    Sales.street,
+    Sales.neighborhood,
+]
+EXPORT_MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+metrics.describe("sales_added_total", "counter", "Sales added")
+metrics.describe("sales_closed_total", "counter", "Sales closed")
+metrics.describe("sales_deleted_total", "counter", "Sales deleted")
+metrics.describe(
+    "stock_reservations_total", "counter", "Stock reservations by result"
+)
+metrics.describe(
+    "stock_reserved_units_total", "counter", "Stock units reserved by sales"
+)
+
+
+def _read_sale_form(form: AddSalesSchema) -> dict:
+    """Decodes and normalizes the fields of a sale form."""
+    sale_data = {
+        "name": unquote(unquote(form.name)).strip().title(),
+        "quantity": form.quantity,
+        "zip_code": unquote(unquote(form.zip_code)),
+        "country": unquote(unquote(form.country)).strip().title(),
+        "city": unquote(unquote(form.city)).strip().title(),
+        "state": unquote(unquote(form.state)).strip().title(),
+        "street": unquote(unquote(form.street)).strip().title(),
+        "neighborhood": unquote(unquote(form.neighborhood)).strip().title(),
+    }
+
+    return sale_data
+
+
+def _check_sale_address(country: str, zip_code: str) -> None:
+    """Validates the country and zip code of a sale."""
+    log.debug("Checking if the country was informed")
+
+    if len(country.strip()) == 0:
+        raise Exception("Country name not given")
+
+    log.debug("Country informed")
+    log.debug(
+        "Checking if the zip is Brazilian and if it is formatted correctly"
+    )
+
+    if (
+        len(zip_code) not in [9, 10] or len(zip_code.split("-")) != 2
+    ) and country in [
+        "Brazil",
+        "Brasil",
+    ]:
+        raise Exception(
+            "Incorrect zip code, expected format: nnnnn-nnn or nnnnn-nnnn"
+        )
+
+    log.debug("Zip code entered correctly")
+
+
+def _select_open_sales(after: tuple, limit: int) -> tuple:
+    """
+    Returns a page of open sales paired with the data of their products,
+    and the cursor of the next page. The products come from the product
+    service when one is configured, or from a join otherwise.
+    Only the columns of the response are selected.
+    """
+    status_open = "Open"
+
+    if product_service.enabled:
+        open_sales = database.select_page_data_table(
+            table=Sales,
+            filter_select={Sales.sale_status: status_open},
+            conditions=[],
+            key_columns=[Sales.sales_id],
+            after=after,
+            limit=limit + 1,
+            columns=format_sale_row.columns,
+        )
+    else:
+        open_sales = database.select_join_data_table(
+            tables=format_sale_row.columns + format_sale_product_row.columns,
+            join_table=Product,
+            join_condition=Sales.name == Product.name,
+            filter_select={Sales.sale_status: status_open},
+            key_columns=[Sales.sales_id],
+            after=after,
+            limit=limit + 1,
+        )
+
+    next_cursor = None
+
+    if len(open_sales) > limit:
+        open_sales = open_sales[:limit]
+        next_cursor = open_sales[-1].sales_id
+
+    sales_data = [format_sale_row(row) for row in open_sales]
+
+    if product_service.enabled:
+        products = product_service.fetch_products(
+            [sale_data["name"] for sale_data in sales_data]
+        )
+        sales_products = [
+            (sale_data, products.get(sale_data["name"]))
+            for sale_data in sales_data
+        ]
+    else:
+        product_name_index = len(format_sale_row.columns)
+        sales_products = [
+            (
+                sale_data,
+                format_sale_product_row(row)
+                if row[product_name_index] is not None
+                else None,
+            )
+            for sale_data, row in zip(sales_data, open_sales)
+        ]
+
+    return sales_products, next_cursor
+
+
+def _write_export(rows, file_format: str):
+    """
+    Yields the exported sales as CSV or NDJSON text,
+    one chunk for each batch of rows.
+    """
+    column_names = [column.key for column in EXPORT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    exported_rows = 0
+
+    if file_format == "csv":
+        writer.writerow(column_names)
+
+    for row in rows:
+        values = format_export_row(row)
+
+        if file_format == "csv":
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(column_names, values))))
+            buffer.write("\n")
+
+        exported_rows += 1
+
+        if exported_rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+    log.debug("%s sales exported", exported_rows)
+
+
+def _check_sale_version(sale: Sales, expected_version: int) -> None:
+    """Checks that the sale is still at the version the client expects."""
+    log.debug("Checking the version of the sale %s", sale.sales_id)
+
+    if expected_version not in [None, sale.version]:
+        raise ConflictError(
+            f"The sale is at version {sale.version}, "
+            f"expected {expected_version}"
+        )
+
+
+def _record_reservation(quantities: dict, unavailable_products: list) -> None:
+    """Counts the result of a stock reservation in the metrics."""
+    if unavailable_products:
+        metrics.increment(
+            "stock_reservations_total", (("result", "insufficient"),)
+        )
+        return
+
+    metrics.increment("stock_reservations_total", (("result", "reserved"),))
+    metrics.increment(
+        "stock_reserved_units_total", value=sum(quantities.values())
+    )
 
 
 @app.post(
@@ -30,106 +229,239 @@ TAG_SALES = Tag(name="Sales", description="Sales data control routes.")
 )
 def add_sale(form: AddSalesSchema):
     """Add a new sale to the sales table."""
-    log.add_message("Add_sale route accessed")
+    log.debug("Add_sale route accessed")
 
-    name = unquote(unquote(form.name)).strip().title()
-    quantity = form.quantity
-    zip_code = unquote(unquote(form.zip_code))
-    country = unquote(unquote(form.country)).strip().title()
-    city = unquote(unquote(form.city)).strip().title()
-    state = unquote(unquote(form.state)).strip().title()
-    street = unquote(unquote(form.street)).strip().title()
-    neighborhood = unquote(unquote(form.neighborhood)).strip().title()
+    sale_data = _read_sale_form(form)
+    name = sale_data["name"]
+    quantity = sale_data["quantity"]
 
     try:
-        log.add_message("Checking if the country was informed")
-
-        if len(country.strip()) == 0:
-            raise Exception("Country name not given")
-
-        log.add_message("Country informed")
-        log.add_message(
-            "Checking if the zip is Brazilian and if it is formatted correctly"
-        )
-
-        if (
-            len(zip_code) not in [9, 10] or len(zip_code.split("-")) != 2
-        ) and country in [
-            "Brazil",
-            "Brasil",
-        ]:
-            raise Exception(
-                "Incorrect zip code, expected format: nnnnn-nnn or nnnnn-nnnn"
-            )
+        _check_sale_address(sale_data["country"], sale_data["zip_code"])
 
-        log.add_message("Zip code entered correctly")
+        registered_product = get_product_data(name)
 
-        registered_product = database.select_value_table_parameter(
-            column=Product.name, filter_select={Product.name: name}
-        )
-
-        log.add_message(f"Checking if the {name} product exists")
+        log.debug("Checking if the %s product exists", name)
 
-        if len(registered_product) == 0:
+        if registered_product is None:
             raise Exception("The product does not exist")
 
-        log.add_message(f"{name} product exists")
+        log.debug("%s product exists", name)
 
-        available_stock = database.select_value_table_parameter(
-            column=Product.available_stock, filter_select={Product.name: name}
-        )
+        available_stock = registered_product["available_stock"]
 
-        log.add_message(f"Checking if there are {quantity} units in stock")
+        log.debug("Checking if there are %s units in stock", quantity)
 
         if quantity > available_stock:
             raise Exception(
                 f"There are only {available_stock} unit(s) available in stock"
             )
 
-        log.add_message(f"Available stock is {available_stock} units")
-        log.add_message("")
+        log.debug("Available stock is %s units", available_stock)
+
+        with database.transaction():
+            (
+                unavailable_products,
+                reserved_products,
+            ) = database.reserve_stock_data_table(
+                table=Product,
+                key_column=Product.name,
+                stock_column=Product.available_stock,
+                quantities={name: quantity},
+                columns=[Product.price, Product.category],
+            )
 
-        new_stock = available_stock - quantity
-        update_form = UpdateProductSchema(name=name, new_stock=new_stock)
-        update_response = update_stock(update_form)[0]
+            if not unavailable_products:
+                product = reserved_products[name]
+                value = round(product.price * quantity, 2)
+                new_sale = Sales(
+                    value=value, category=product.category, **sale_data
+                )
 
-        if update_response["message"] != "Updated stock":
-            raise Exception("Error updating stock")
+                database.insert_all_data_table([new_sale])
+                formatted_response = format_add_sale_response(sale=new_sale)
+                update_sales_summary(
+                    sales=[new_sale],
+                    sale_status="Open",
+                    sign=1,
+                )
 
-        price = database.select_value_table_parameter(
-            column=Product.price, filter_select={Product.name: name}
-        )
-        value = round(price * quantity, 2)
-
-        new_sale = Sales(
-            name=name,
-            quantity=quantity,
-            value=value,
-            zip_code=zip_code,
-            country=country,
-            city=city,
-            state=state,
-            street=street,
-            neighborhood=neighborhood,
-        )
-        formatted_response = format_add_sale_response(sale=new_sale)
-        database.insert_data_table(new_sale)
+        product_cache.invalidate(name)
+        _record_reservation({name: quantity}, unavailable_products)
+
+        log.debug("Reserving %s units of %s", quantity, name)
+
+        if unavailable_products:
+            raise Exception(
+                f"There are no longer {quantity} unit(s) available in stock"
+            )
 
-        log.add_message(f"{name} sale added")
+        log.debug("%s stock updated and sale added", name)
+        metrics.increment("sales_added_total")
 
         return_data = {"message": "Added Sale", "sale": formatted_response}
 
-        log.add_message(f"Add_sale response: {return_data}")
-        log.add_message("Add_sale status: 200")
-        log.add_message("")
+        log.debug("Add_sale response: %s", return_data)
+        log.info("Add_sale status: 200")
+        log.info("")
 
         return return_data, 200
     except Exception as error:
         return_data = {"message": f"Error: {error}"}
 
-        log.add_message(f"Add_sale response: {return_data}")
-        log.add_message("Add_sale status: 400")
-        log.add_message("")
+        log.debug("Add_sale response: %s", return_data)
+        log.warning("Add_sale status: 400")
+        log.info("")
+
+        return return_data, 400
+
+
+@app.post(
+    "/add_sales",
+    tags=[TAG_SALES],
+    responses={
+        "200": MessageBulkSalesSchema,
+        "400": MessageBulkSalesSchema,
+    },
+)
+def add_sales(body: AddSalesListSchema):
+    """
+    Add several sales to the sales table at once.
+    Either every sale is added or none of them is.
+    """
+    log.debug("Add_sales route accessed")
+
+    sales_data = [_read_sale_form(item) for item in body.sales]
+    item_errors = {}
+
+    try:
+        log.debug("Checking if sales were informed")
+
+        if len(sales_data) == 0:
+            raise Exception("No sales given")
+
+        log.debug("%s sales informed", len(sales_data))
+
+        for index, sale_data in enumerate(sales_data):
+            try:
+                _check_sale_address(
+                    sale_data["country"], sale_data["zip_code"]
+                )
+            except Exception as error:
+                item_errors[index] = f"Error: {error}"
+
+        names = list({sale_data["name"] for sale_data in sales_data})
+        registered_products = {
+            product.name: product
+            for product in database.select_values_table_in(
+                columns=[Product.name, Product.available_stock],
+                filter_in={Product.name: names},
+            )
+        }
+
+        log.debug("Checking if the products exist and have stock")
+
+        quantities = {}
+
+        for sale_data in sales_data:
+            name = sale_data["name"]
+            quantities[name] = quantities.get(name, 0) + sale_data["quantity"]
+
+        for index, sale_data in enumerate(sales_data):
+            product = registered_products.get(sale_data["name"])
+
+            if product is None:
+                item_errors.setdefault(
+                    index, "Error: The product does not exist"
+                )
+            elif quantities[product.name] > product.available_stock:
+                item_errors.setdefault(
+                    index,
+                    f"Error: There are only {product.available_stock} "
+                    "unit(s) available in stock",
+                )
+
+        if item_errors:
+            raise Exception(f"{len(item_errors)} sale(s) are invalid")
+
+        log.debug("All sales are valid")
+
+        with database.transaction():
+            (
+                unavailable_products,
+                reserved_products,
+            ) = database.reserve_stock_data_table(
+                table=Product,
+                key_column=Product.name,
+                stock_column=Product.available_stock,
+                quantities=quantities,
+                columns=[Product.price, Product.category],
+            )
+
+            if not unavailable_products:
+                new_sales = []
+
+                for sale_data in sales_data:
+                    product = reserved_products[sale_data["name"]]
+                    value = round(product.price * sale_data["quantity"], 2)
+                    new_sales.append(
+                        Sales(
+                            value=value,
+                            category=product.category,
+                            **sale_data,
+                        )
+                    )
+
+                database.insert_all_data_table(new_sales)
+                formatted_response = [
+                    format_add_sale_response(sale=new_sale)
+                    for new_sale in new_sales
+                ]
+                update_sales_summary(
+                    sales=new_sales,
+                    sale_status="Open",
+                    sign=1,
+                )
+
+        for name in quantities:
+            product_cache.invalidate(name)
+
+        _record_reservation(quantities, unavailable_products)
+
+        log.debug("Reserving stock of %s products", len(quantities))
+
+        for index, sale_data in enumerate(sales_data):
+            if sale_data["name"] in unavailable_products:
+                quantity = quantities[sale_data["name"]]
+                item_errors[index] = (
+                    f"Error: There are no longer {quantity} "
+                    "unit(s) available in stock"
+                )
+
+        if item_errors:
+            raise Exception(f"{len(item_errors)} sale(s) are invalid")
+
+        log.debug("%s sales added", len(new_sales))
+        metrics.increment("sales_added_total", value=len(new_sales))
+
+        return_data = {"message": "Added Sales", "sales": formatted_response}
+
+        log.debug("Add_sales response: %s", return_data)
+        log.info("Add_sales status: 200")
+        log.info("")
+
+        return return_data, 200
+    except Exception as error:
+        return_data = {
+            "message": f"Error: {error}",
+            "sales": [
+                {"index": index, "message": message}
+                for index, message in sorted(item_errors.items())
+            ],
+        }
+
+        log.debug("Add_sales response: %s", return_data)
+        log.warning("Add_sales status: 400")
+        log.info("")
 
         return return_data, 400
 
@@ -140,59 +472,78 @@ def add_sale(form: AddSalesSchema):
     responses={
         "200": SingleMessageSchema,
         "400": SingleMessageSchema,
+        "409": SingleMessageSchema,
     },
 )
 def close_sale(form: CloseSaleSchema):
     """Closes a sale from the sales table."""
-    log.add_message("Close_sale route accessed")
+    log.debug("Close_sale route accessed")
 
     sales_id = form.sales_id
 
     try:
-        registered_sale = database.select_value_table_parameter(
-            column=Sales.sales_id, filter_select={Sales.sales_id: sales_id}
+        sale = database.select_first_data_table(
+            table=Sales, filter_select={Sales.sales_id: sales_id}
         )
 
-        log.add_message(f"Checking if the sale {sales_id} exists")
+        log.debug("Checking if the sale %s exists", sales_id)
 
-        if not registered_sale:
+        if sale is None:
             raise Exception(f"The sale {sales_id} does not exist")
 
-        log.add_message("The sale exists")
-
-        sale_status = database.select_value_table_parameter(
-            column=Sales.sale_status, filter_select={Sales.sales_id: sales_id}
-        )
-
-        log.add_message(f"Checking if sale {sales_id} is closed")
+        log.debug("The sale exists")
+        log.debug("Checking if sale %s is closed", sales_id)
 
-        if sale_status == "Closed":
+        if sale.sale_status == "Closed":
             raise Exception(f"The sale {sales_id} is already closed")
 
-        log.add_message("The sale is open")
+        log.debug("The sale is open")
+        _check_sale_version(sale, form.expected_version)
 
         new_sale_status = "Closed"
-        database.update_data_table(
-            table=Sales,
-            filter_update={Sales.sales_id: sales_id},
-            new_data={Sales.sale_status: new_sale_status},
-        )
 
-        log.add_message(f"Sale {sales_id} closed")
+        with database.transaction():
+            update_sales_summary(
+                sales=[sale],
+                sale_status=sale.sale_status,
+                sign=-1,
+            )
+            update_sales_summary(
+                sales=[sale],
+                sale_status=new_sale_status,
+                sign=1,
+            )
+            database.update_data_table(
+                table=Sales,
+                filter_update={Sales.sales_id: sales_id},
+                new_data={Sales.sale_status: new_sale_status},
+                expected_version=sale.version,
+            )
+
+        log.debug("Sale %s closed", sales_id)
+        metrics.increment("sales_closed_total")
 
         return_data = {"message": f"Sale {sales_id} closed successfully"}
 
-        log.add_message(f"Close_sale response: {return_data}")
-        log.add_message("Close_sale status: 200")
-        log.add_message("")
+        log.debug("Close_sale response: %s", return_data)
+        log.info("Close_sale status: 200")
+        log.info("")
 
         return return_data, 200
+    except ConflictError as error:
+        return_data = {"message": f"Error: {error}"}
+
+        log.debug("Close_sale response: %s", return_data)
+        log.warning("Close_sale status: 409")
+        log.info("")
+
+        return return_data, 409
     except Exception as error:
         return_data = {"message": f"Error: {error}"}
 
-        log.add_message(f"Close_sale response: {return_data}")
-        log.add_message("Close_sale status: 400")
-        log.add_message("")
+        log.debug("Close_sale response: %s", return_data)
+        log.warning("Close_sale status: 400")
+        log.info("")
 
         return return_data, 400
 
@@ -205,65 +556,113 @@ def close_sale(form: CloseSaleSchema):
         "400": SingleMessageSchema,
     },
 )
-def get_sales():
-    """Method to get all open sales data."""
-    log.add_message("Get_sales route accessed")
+def get_sales(query: SalesPageSchema):
+    """
+    Method to get open sales data, a page at a time.
+    Pass the returned next_cursor as after to get the next page.
+    """
+    log.debug("Get_sales route accessed")
+
+    limit = query.limit
+    after = None if query.after is None else (query.after,)
 
     try:
-        status_open = "Open"
-        open_sales = database.select_data_table(
-            table=Sales,
-            filter_select={Sales.sale_status: status_open},
-        )
+        open_sales, next_cursor = _select_open_sales(after, limit)
 
-        log.add_message("Checking if there are open sales")
+        log.debug("Checking if there are open sales")
 
-        if len(open_sales) == 0:
+        if len(open_sales) == 0 and after is None:
             raise Exception("There are no open sales")
 
-        log.add_message(f"There are {len(open_sales)} open sales")
-        log.add_message("")
+        log.debug("There are %s open sales in the page", len(open_sales))
 
         full_content = []
 
-        for sale in open_sales:
-            sale_product_data = {}
+        # The sale is merged last, so its own fields such as the version
+        # are kept when the product data has a field of the same name
+        for sale_data, product_data in open_sales:
+            full_content.append({**(product_data or {}), **sale_data})
 
-            sales_id = sale.sales_id
-            sale_product_data["sales_id"] = sales_id
+        return_data = {
+            "message": "Open sales consulted",
+            "sales": full_content,
+            "next_cursor": next_cursor,
+        }
 
-            sale_date = sale.sale_date
-            sale_product_data["sale_date"] = sale_date
+        log.debug("Get_sales response: %s", return_data)
+        log.info("Get_sales status: 200")
+        log.info("")
 
-            other_sale_data = format_add_sale_response(sale)
-            sale_product_data.update(other_sale_data)
+        return return_data, 200
+    except Exception as error:
+        return_data = {"message": f"Error: {error}"}
 
-            get_product_url = "http://127.0.0.1:5000/get_product/?name="
-            name = sale_product_data.get("name")
-            response_get_product = requests.get(f"{get_product_url}{name}")
+        log.debug("Get_sales response: %s", return_data)
+        log.warning("Get_sales status: 400")
+        log.info("")
 
-            if response_get_product.status_code == 200:
-                product_data = response_get_product.json()["product"]
-                sale_product_data.update(product_data)
+        return return_data, 400
 
-            full_content.append(sale_product_data)
 
-        return_data = {
-            "message": "Open sales consulted",
-            "sales": full_content
-        }
+@app.get(
+    "/export_sales",
+    tags=[TAG_SALES],
+    responses={"400": SingleMessageSchema},
+)
+def export_sales(query: ExportSalesSchema):
+    """
+    Streams every sale, open or closed, as CSV or NDJSON,\
+    optionally from a start date until an end date.
+    """
+    log.debug("Export_sales route accessed")
+
+    file_format = query.file_format.strip().lower()
+    conditions = []
+
+    if query.start_date is not None:
+        conditions.append(
+            Sales.sale_date >= datetime.combine(query.start_date, time.min)
+        )
 
-        log.add_message(f"Get_sales response: {return_data}")
-        log.add_message("Get_sales status: 200")
-        log.add_message("")
+    if query.end_date is not None:
+        conditions.append(
+            Sales.sale_date
+            < datetime.combine(query.end_date + timedelta(days=1), time.min)
+        )
 
-        return return_data, 200
+    try:
+        log.debug("Checking if the %s format is supported", file_format)
+
+        if file_format not in EXPORT_MIMETYPES:
+            raise Exception("Unsupported format, expected csv or ndjson")
+
+        rows = database.stream_data_table(
+            columns=EXPORT_COLUMNS,
+            filter_select={},
+            conditions=conditions,
+            key_columns=[Sales.sales_id],
+            batch_size=EXPORT_BATCH_SIZE,
+        )
+        response = Response(
+            stream_with_context(_write_export(rows, file_format)),
+            mimetype=EXPORT_MIMETYPES[file_format],
+            headers={
+                "Content-Disposition": (
+                    f"attachment; filename=sales.{file_format}"
+                )
+            },
+        )
+
+        log.info("Export_sales status: 200")
+        log.info("")
+
+        return response
     except Exception as error:
         return_data = {"message": f"Error: {error}"}
 
-        log.add_message(f"Get_sales response: {return_data}")
-        log.add_message("Get_sales status: 400")
-        log.add_message("")
+        log.debug("Export_sales response: %s", return_data)
+        log.warning("Export_sales status: 400")
+        log.info("")
 
         return return_data, 400
 
@@ -274,58 +673,71 @@ def get_sales():
     responses={
         "200": SingleMessageSchema,
         "400": SingleMessageSchema,
+        "409": SingleMessageSchema,
     },
 )
 def delete_sale(form: CloseSaleSchema):
     """Deletes an open sale from the sales table."""
-    log.add_message("Delete_sale route accessed")
+    log.debug("Delete_sale route accessed")
 
     sales_id = form.sales_id
 
     try:
-        registered_sale = database.select_value_table_parameter(
-            column=Sales.sale_status, filter_select={Sales.sales_id: sales_id}
+        sale = database.select_first_data_table(
+            table=Sales, filter_select={Sales.sales_id: sales_id}
         )
 
-        log.add_message(f"Checking if the sale {sales_id} exists")
+        log.debug("Checking if the sale %s exists", sales_id)
 
-        if not registered_sale:
+        if sale is None:
             raise Exception(f"The sale {sales_id} does not exist")
 
-        log.add_message("The sale exists")
-
-        sale_status = database.select_value_table_parameter(
-            column=Sales.sale_status, filter_select={Sales.sales_id: sales_id}
-        )
-
-        log.add_message(f"Checking if sale {sales_id} is closed")
+        log.debug("The sale exists")
+        log.debug("Checking if sale %s is closed", sales_id)
 
-        if sale_status == "Closed":
+        if sale.sale_status == "Closed":
             raise Exception(
                 f"The sale {sales_id} is closed, it is not possible to delete"
             )
 
-        log.add_message("The sale is open")
+        log.debug("The sale is open")
+        _check_sale_version(sale, form.expected_version)
 
-        database.delete_data_table(
-            table=Sales,
-            filter_delete={Sales.sales_id: sales_id},
-        )
+        with database.transaction():
+            update_sales_summary(
+                sales=[sale],
+                sale_status=sale.sale_status,
+                sign=-1,
+            )
+            database.delete_data_table(
+                table=Sales,
+                filter_delete={Sales.sales_id: sales_id},
+                expected_version=sale.version,
+            )
 
-        log.add_message(f"Sale {sales_id} deleted")
+        log.debug("Sale %s deleted", sales_id)
+        metrics.increment("sales_deleted_total")
 
         return_data = {"message": f"Sale {sales_id} deleted successfully"}
 
-        log.add_message(f"Delete_sale response: {return_data}")
-        log.add_message("Delete_sale status: 200")
-        log.add_message("")
+        log.debug("Delete_sale response: %s", return_data)
+        log.info("Delete_sale status: 200")
+        log.info("")
 
         return return_data, 200
+    except ConflictError as error:
+        return_data = {"message": f"Error: {error}"}
+
+        log.debug("Delete_sale response: %s", return_data)
+        log.warning("Delete_sale status: 409")
+        log.info("")
+
+        return return_data, 409
     except Exception as error:
         return_data = {"message": f"Error: {error}"}
 
-        log.add_message(f"Delete_sale response: {return_data}")
-        log.add_message("Delete_sale status: 400")
-        log.add_message("")
+        log.debug("Delete_sale response: %s", return_data)
+        log.warning("Delete_sale status: 400")
+        log.info("")
 
         return return_data, 400
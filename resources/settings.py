@@ -1,18 +1,84 @@
+import decimal
+import uuid
+from datetime import date
+from typing import Callable
+
+import orjson
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from flask_openapi3 import Info, OpenAPI
+from werkzeug.http import http_date
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Class to encode the JSON of the aplication with orjson,
+    producing the same documents as the default provider
+    """
+
+    OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    @staticmethod
+    def _default(value):
+        """Method to encode the values orjson does not encode by itself"""
+        if isinstance(value, date):
+            return http_date(value)
+
+        if isinstance(value, (decimal.Decimal, uuid.UUID)):
+            return str(value)
+
+        if hasattr(value, "__html__"):
+            return str(value.__html__())
+
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON")
+
+    def _encode(self, obj) -> bytes:
+        """Method to encode an object, indented in debug mode"""
+        options = self.OPTIONS
+
+        if self._app.debug:
+            options |= orjson.OPT_INDENT_2
+
+        return orjson.dumps(obj, default=self._default, option=options)
+
+    def dumps(self, obj, **kwargs) -> str:
+        """Method to encode an object as a JSON string"""
+        return self._encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        """Method to decode a JSON string or bytes"""
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Method to build a JSON response without an extra decode"""
+        obj = self._prepare_response_obj(args, kwargs)
+
+        return self._app.response_class(
+            self._encode(obj) + b"\n", mimetype="application/json"
+        )
 
 
 class Settings:
     """Class to define all Flask settings"""
 
     def __init__(
-        self, information: Info, secret_key: str, port: int, host: str
+        self,
+        information: Info,
+        secret_key: str,
+        port: int,
+        host: str,
+        server_mode: str = "development",
+        workers: int = 2,
+        threads: int = 4,
     ):
         self._app = None
         self._information = information
         self._secret_key = secret_key
         self._port = port
         self._host = host
+        self._server_mode = server_mode
+        self._workers = workers
+        self._threads = threads
 
     @property
     def app(self):
@@ -22,12 +88,46 @@ class Settings:
     def generate_app(self) -> None:
         """Method to generate app"""
         self._app = OpenAPI(__name__, info=self._information)
+        self._app.json = OrjsonProvider(self._app)
         self._app.secret_key = self._secret_key
         CORS(self._app)
 
-    def run_aplication(self) -> None:
-        """Method to start the flask aplication"""
+    def _run_production_server(self, on_worker_start: Callable) -> None:
+        """Method to serve the aplication with gunicorn workers"""
+        from gunicorn.app.base import BaseApplication
+
+        flask_app = self._app
+        options = {
+            "bind": f"{self._host}:{self._port}",
+            "workers": self._workers,
+            "threads": self._threads,
+        }
+
+        if on_worker_start is not None:
+            options["post_fork"] = lambda server, worker: on_worker_start()
+
+        class ProductionServer(BaseApplication):
+            """Class to run the flask aplication under gunicorn"""
+
+            def load_config(self):
+                for key, value in options.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return flask_app
+
+        ProductionServer().run()
+
+    def run_aplication(self, on_worker_start: Callable = None) -> None:
+        """
+        Method to start the flask aplication, with the debug server
+        in development mode or with several workers in production mode.
+        on_worker_start runs in each worker right after it is forked.
+        """
         if self._app is None:
             self.generate_app()
 
-        self._app.run(debug=True, port=self._port, host=self._host)
+        if self._server_mode == "production":
+            self._run_production_server(on_worker_start)
+        else:
+            self._app.run(debug=True, port=self._port, host=self._host)
@@ -1,6 +1,20 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 from database.model.product import Product
+from schemas.rows import RowMapper
+
+PRODUCT_DATA_COLUMNS = [
+    Product.name,
+    Product.price,
+    Product.supplier,
+    Product.category,
+    Product.description,
+    Product.available_stock,
+]
+PRODUCT_RESPONSE_COLUMNS = PRODUCT_DATA_COLUMNS + [Product.version]
+format_product_row = RowMapper(PRODUCT_RESPONSE_COLUMNS)
 
 
 class AddProductSchema(BaseModel):
@@ -19,6 +33,41 @@ class AddProductSchema(BaseModel):
     available_stock: int = 1
 
 
+class ImportProductsSchema(BaseModel):
+    """
+    Defines the format of the products \
+    sent to the import route: ndjson or csv.
+    """
+
+    file_format: str = "ndjson"
+
+
+class ProductRowSchema(BaseModel):
+    """
+    Defines how each product of an \
+    import should be.
+    """
+
+    name: str
+    price: float
+    supplier: str
+    category: str
+    description: str
+    available_stock: int
+
+
+class MessageImportProductsSchema(BaseModel):
+    """
+    Defines how the API response should be \
+    for a product import.
+    """
+
+    message: str
+    inserted: int
+    updated: int
+    rejected: int
+
+
 class MessageProductSchema(BaseModel):
     """
     Defines how the API response should be \
@@ -29,6 +78,16 @@ class MessageProductSchema(BaseModel):
     product: dict
 
 
+class MessageProductCacheSchema(BaseModel):
+    """
+    Defines how the API response should be \
+    for the product cache statistics.
+    """
+
+    message: str
+    cache: dict
+
+
 class SingleMessageSchema(BaseModel):
     """
     Defines how the API response should be \
@@ -46,6 +105,34 @@ class UpdateProductSchema(BaseModel):
 
     name: str = "Iphone 13"
     new_stock: int = 1
+    expected_version: Optional[int] = None
+
+
+class ProductListSchema(BaseModel):
+    """
+    Defines the filters, sorting and \
+    pagination of the product listing.
+    """
+
+    category: Optional[str] = None
+    supplier: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    in_stock: bool = False
+    sort: str = "name"
+    limit: int = Field(100, ge=1, le=1000)
+    after: Optional[str] = None
+
+
+class ProductListResponseSchema(BaseModel):
+    """
+    Defines how the API response should be \
+    when listing products.
+    """
+
+    message: str
+    products: list
+    next_cursor: Optional[str]
 
 
 class ProductNameSchema(BaseModel):
@@ -68,12 +155,15 @@ def format_product_response(product: Product) -> dict:
         "category": product.category,
         "description": product.description,
         "available_stock": product.available_stock,
+        "version": product.version,
     }
 
     return response
 
 
-def format_update_product_response(name: str, old_stock: int, new_stock: int) -> dict:
+def format_update_product_response(
+    name: str, old_stock: int, new_stock: int, version: int
+) -> dict:
     """
     Format the API response for a update product.
     """
@@ -81,6 +171,7 @@ def format_update_product_response(name: str, old_stock: int, new_stock: int) ->
         "name": name,
         "old_available_stock": old_stock,
         "new_available_stock": new_stock,
+        "version": version,
     }
 
     return response
@@ -0,0 +1,41 @@
+from datetime import date
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class SalesReportSchema(BaseModel):
+    """
+    Defines how the grouping, period and status \
+    of a sales report should be informed.
+    """
+
+    group_by: str = "product"
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    sale_status: Optional[str] = None
+
+
+class MessageSalesReportSchema(BaseModel):
+    """
+    Defines how the API response should be \
+    for a sales report.
+    """
+
+    message: str
+    group_by: str
+    rows: list
+
+
+def format_report_row(group: object, row: object) -> dict:
+    """
+    Format a group of the sales report.
+    """
+    response = {
+        "group": str(group),
+        "quantity": row.quantity,
+        "value": round(row.value, 2),
+        "sales_count": row.sales_count,
+    }
+
+    return response
@@ -0,0 +1,20 @@
+class RowMapper:
+    """
+    Class to convert the selected columns of a row into a response dict.
+    The keys are computed once, so each row is converted by a single
+    zip over its values instead of reading attributes one by one.
+    """
+
+    def __init__(self, columns: list, start: int = 0):
+        self._columns = list(columns)
+        self._keys = tuple(column.key for column in self._columns)
+        self._slice = slice(start, start + len(self._columns))
+
+    @property
+    def columns(self) -> list:
+        """Method to return the columns to be selected"""
+        return list(self._columns)
+
+    def __call__(self, row: tuple) -> dict:
+        """Method to convert the columns of a row into a dict"""
+        return dict(zip(self._keys, row[self._slice]))
@@ -1,6 +1,30 @@
-from pydantic import BaseModel
+from datetime import date, datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
 
 from database.model.sales import Sales
+from schemas.products import PRODUCT_DATA_COLUMNS
+from schemas.rows import RowMapper
+
+SALE_RESPONSE_COLUMNS = [
+    Sales.sales_id,
+    Sales.sale_date,
+    Sales.name,
+    Sales.quantity,
+    Sales.value,
+    Sales.zip_code,
+    Sales.country,
+    Sales.city,
+    Sales.state,
+    Sales.street,
+    Sales.neighborhood,
+    Sales.version,
+]
+format_sale_row = RowMapper(SALE_RESPONSE_COLUMNS)
+format_sale_product_row = RowMapper(
+    PRODUCT_DATA_COLUMNS, start=len(SALE_RESPONSE_COLUMNS)
+)
 
 
 class AddSalesSchema(BaseModel):
@@ -10,7 +34,7 @@ class AddSalesSchema(BaseModel):
     """
 
     name: str = "Iphone 13"
-    quantity: int = 1
+    quantity: int = Field(1, ge=1)
     zip_code: str = "01025-020"
     country: str = "Brazil"
     city: str = "São Paulo"
@@ -19,6 +43,15 @@ class AddSalesSchema(BaseModel):
     neighborhood = ""
 
 
+class AddSalesListSchema(BaseModel):
+    """
+    Defines how the structure for adding \
+    several sales at once should be.
+    """
+
+    sales: List[AddSalesSchema] = [AddSalesSchema()]
+
+
 class MessageSalesSchema(BaseModel):
     """
     Defines how the API response should be \
@@ -29,6 +62,16 @@ class MessageSalesSchema(BaseModel):
     sale: dict
 
 
+class MessageBulkSalesSchema(BaseModel):
+    """
+    Defines how the API response should be \
+    when adding several sales at once.
+    """
+
+    message: str
+    sales: list
+
+
 class SingleMessageSchema(BaseModel):
     """
     Defines how the API response should be \
@@ -45,6 +88,28 @@ class CloseSaleSchema(BaseModel):
     """
 
     sales_id: int = 1
+    expected_version: Optional[int] = None
+
+
+class SalesPageSchema(BaseModel):
+    """
+    Defines how the pagination of the \
+    open sales should be informed.
+    """
+
+    limit: int = Field(100, ge=1, le=1000)
+    after: Optional[int] = None
+
+
+class ExportSalesSchema(BaseModel):
+    """
+    Defines how the format and the period \
+    of a sales export should be informed.
+    """
+
+    file_format: str = "csv"
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
 
 
 class SaleResponseSchema(BaseModel):
@@ -54,7 +119,20 @@ class SaleResponseSchema(BaseModel):
     """
 
     message: str
-    data: list
+    sales: list
+    next_cursor: Optional[int]
+
+
+def format_export_row(row: object) -> list:
+    """
+    Format an exported sale as a list of values.
+    """
+    response = [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in row
+    ]
+
+    return response
 
 
 def format_add_sale_response(sale: Sales) -> dict:
@@ -71,6 +149,7 @@ def format_add_sale_response(sale: Sales) -> dict:
         "state": sale.state,
         "street": sale.street,
         "neighborhood": sale.neighborhood,
+        "version": sale.version,
     }
 
     return response